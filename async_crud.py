@@ -0,0 +1,140 @@
+from contextlib import asynccontextmanager
+from functools import wraps
+from sqlalchemy.ext.asyncio import AsyncSession
+import crud
+from crud import STREAM_CHUNK_SIZE, UNIT_OF_WORK_KEY, UNIT_OF_WORK_REFRESH_KEY
+
+# Асинхронные варианты CRUD-операций для сервисов на asyncio (AsyncSession + asyncpg).
+# Методы выполняют те же синхронные CRUD-методы через AsyncSession.run_sync: код запросов
+# общий, а ожидание БД переключает greenlet внутри цикла событий без отдельного потока.
+# Ленивые связи (worker.activities и т.п.) в асинхронном режиме не догружаются -
+# нужные данные следует получать отдельными методами
+
+
+def _run_sync(method):
+    """Асинхронный вариант синхронного CRUD-метода с сигнатурой (db, ...)"""
+    @wraps(method)
+    async def wrapper(db: AsyncSession, *args, **kwargs):
+        return await db.run_sync(method, *args, **kwargs)
+    return staticmethod(wrapper)
+
+
+def _stream(query_builder):
+    """
+    Асинхронный вариант iter_* метода: запрос строится тем же построителем _*_query
+    и читается серверным курсором пачками по chunk_size
+    """
+    async def wrapper(db: AsyncSession, *args, chunk_size: int = STREAM_CHUNK_SIZE):
+        query = query_builder(db.sync_session, *args)
+        result = await db.stream_scalars(query.statement, execution_options={"yield_per": chunk_size})
+        try:
+            async for obj in result:
+                yield obj
+        finally:
+            await result.close()
+    return staticmethod(wrapper)
+
+
+@asynccontextmanager
+async def unit_of_work(db: AsyncSession, refresh: bool = False):
+    """Асинхронный вариант crud.unit_of_work: один commit на весь блок async with"""
+    info = db.sync_session.info
+    if info.get(UNIT_OF_WORK_KEY):
+        yield db
+        return
+
+    info[UNIT_OF_WORK_KEY] = True
+    info[UNIT_OF_WORK_REFRESH_KEY] = refresh
+    try:
+        yield db
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        info.pop(UNIT_OF_WORK_KEY, None)
+        info.pop(UNIT_OF_WORK_REFRESH_KEY, None)
+
+
+async def stream_rows(db: AsyncSession, statement, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Асинхронный вариант crud.stream_rows: строки select по столбцам серверным курсором"""
+    result = await db.stream(statement, execution_options={"yield_per": chunk_size})
+    try:
+        async for row in result:
+            yield row
+    finally:
+        await result.close()
+
+
+class TrainCRUD:
+    create_train = _run_sync(crud.TrainCRUD.create_train)
+    bulk_create_trains = _run_sync(crud.TrainCRUD.bulk_create_trains)
+    get_train = _run_sync(crud.TrainCRUD.get_train)
+    get_trains_by_number = _run_sync(crud.TrainCRUD.get_trains_by_number)
+    iter_trains_by_number = _stream(crud.TrainCRUD._trains_by_number_query)
+    get_trains_in_time_range = _run_sync(crud.TrainCRUD.get_trains_in_time_range)
+    iter_trains_in_time_range = _stream(crud.TrainCRUD._trains_in_time_range_query)
+
+
+class UniformCRUD:
+    create_uniform = _run_sync(crud.UniformCRUD.create_uniform)
+    get_uniform = _run_sync(crud.UniformCRUD.get_uniform)
+    get_uniform_by_color = _run_sync(crud.UniformCRUD.get_uniform_by_color)
+    get_or_create_uniform_id = _run_sync(crud.UniformCRUD.get_or_create_uniform_id)
+
+
+class ActivityCRUD:
+    create_activity = _run_sync(crud.ActivityCRUD.create_activity)
+    resolve_activity_ids = _run_sync(crud.ActivityCRUD.resolve_activity_ids)
+    get_activity = _run_sync(crud.ActivityCRUD.get_activity)
+    get_activity_by_name = _run_sync(crud.ActivityCRUD.get_activity_by_name)
+    get_or_create_activity_id = _run_sync(crud.ActivityCRUD.get_or_create_activity_id)
+
+
+class WorkerCRUD:
+    create_worker = _run_sync(crud.WorkerCRUD.create_worker)
+    get_worker = _run_sync(crud.WorkerCRUD.get_worker)
+    close_worker = _run_sync(crud.WorkerCRUD.close_worker)
+    bulk_create_workers = _run_sync(crud.WorkerCRUD.bulk_create_workers)
+    get_workers_by_train = _run_sync(crud.WorkerCRUD.get_workers_by_train)
+    iter_workers_by_train = _stream(crud.WorkerCRUD._workers_by_train_query)
+    get_workers_in_time_range = _run_sync(crud.WorkerCRUD.get_workers_in_time_range)
+    get_workers_in_time_range_page = _run_sync(crud.WorkerCRUD.get_workers_in_time_range_page)
+    iter_workers_in_time_range = _stream(crud.WorkerCRUD._workers_in_time_range_query)
+
+
+class WorkerActivityCRUD:
+    create_worker_activity = _run_sync(crud.WorkerActivityCRUD.create_worker_activity)
+    close_worker_activity = _run_sync(crud.WorkerActivityCRUD.close_worker_activity)
+    bulk_create_worker_activities = _run_sync(crud.WorkerActivityCRUD.bulk_create_worker_activities)
+    get_worker_activities = _run_sync(crud.WorkerActivityCRUD.get_worker_activities)
+    iter_worker_activities = _stream(crud.WorkerActivityCRUD._worker_activities_query)
+    get_activities_in_time_range = _run_sync(crud.WorkerActivityCRUD.get_activities_in_time_range)
+    get_activities_in_time_range_page = _run_sync(crud.WorkerActivityCRUD.get_activities_in_time_range_page)
+    iter_activities_in_time_range = _stream(crud.WorkerActivityCRUD._activities_in_time_range_query)
+
+
+class MeanWorkingTimeCRUD:
+    create_or_update_mean_working_time = _run_sync(crud.MeanWorkingTimeCRUD.create_or_update_mean_working_time)
+    apply_closed_activities = _run_sync(crud.MeanWorkingTimeCRUD.apply_closed_activities)
+    calculate_and_update_all = _run_sync(crud.MeanWorkingTimeCRUD.calculate_and_update_all)
+
+
+class MeanWorkingTimeHistoryCRUD:
+    record_snapshot = _run_sync(crud.MeanWorkingTimeHistoryCRUD.record_snapshot)
+    get_history_range = _run_sync(crud.MeanWorkingTimeHistoryCRUD.get_history_range)
+
+
+class AlertCRUD:
+    create_alert = _run_sync(crud.AlertCRUD.create_alert)
+    get_alert = _run_sync(crud.AlertCRUD.get_alert)
+    bulk_create_alerts = _run_sync(crud.AlertCRUD.bulk_create_alerts)
+    get_alerts_by_worker = _run_sync(crud.AlertCRUD.get_alerts_by_worker)
+    get_alerts_by_worker_page = _run_sync(crud.AlertCRUD.get_alerts_by_worker_page)
+    iter_alerts_by_worker = _stream(crud.AlertCRUD._alerts_by_worker_query)
+    get_alerts_by_type = _run_sync(crud.AlertCRUD.get_alerts_by_type)
+    get_alerts_by_type_page = _run_sync(crud.AlertCRUD.get_alerts_by_type_page)
+    iter_alerts_by_type = _stream(crud.AlertCRUD._alerts_by_type_query)
+    get_alerts_in_time_range = _run_sync(crud.AlertCRUD.get_alerts_in_time_range)
+    get_alerts_in_time_range_page = _run_sync(crud.AlertCRUD.get_alerts_in_time_range_page)
+    iter_alerts_in_time_range = _stream(crud.AlertCRUD._alerts_in_time_range_query)
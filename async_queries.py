@@ -0,0 +1,19 @@
+import queries
+from async_crud import _run_sync
+
+
+class AnalysisQueries:
+    """Асинхронные варианты аналитических запросов queries.AnalysisQueries"""
+
+    find_workers_repairing_train = _run_sync(queries.AnalysisQueries.find_workers_repairing_train)
+    calculate_activity_time_by_uniform = _run_sync(queries.AnalysisQueries.calculate_activity_time_by_uniform)
+    get_workers_presence_timeline = _run_sync(queries.AnalysisQueries.get_workers_presence_timeline)
+    get_depot_presence_timeline = _run_sync(queries.AnalysisQueries.get_depot_presence_timeline)
+    calculate_helmet_usage_percentage = _run_sync(queries.AnalysisQueries.calculate_helmet_usage_percentage)
+    get_helmet_compliance = _run_sync(queries.AnalysisQueries.get_helmet_compliance)
+    refresh_helmet_compliance_rollup = _run_sync(queries.AnalysisQueries.refresh_helmet_compliance_rollup)
+    get_worker_activity_timeline = _run_sync(queries.AnalysisQueries.get_worker_activity_timeline)
+    get_busiest_trains = _run_sync(queries.AnalysisQueries.get_busiest_trains)
+    get_latest_time = _run_sync(queries.AnalysisQueries.get_latest_time)
+    get_activity_counts = _run_sync(queries.AnalysisQueries.get_activity_counts)
+    get_uniform_counts = _run_sync(queries.AnalysisQueries.get_uniform_counts)
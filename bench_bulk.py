@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta
+import sys
+import time
+from database import get_session, create_tables, get_engine, BENCH_DATABASE_URL
+import models
+import crud
+
+# Количество строк для каждого замера
+ROWS = 2000
+
+# Справочные значения и номер поезда бенчмарка; после замеров все удаляется
+BENCH_NAME = "бенчмарк"
+BENCH_TRAIN_NUMBER = "BENCH-000"
+
+
+def _prepare_refs(db):
+    """Возвращает id поезда, униформы и вида деятельности для тестовых записей"""
+    uniform_id = crud.UniformCRUD.get_or_create_uniform_id(db, BENCH_NAME)
+    activity_id = crud.ActivityCRUD.get_or_create_activity_id(db, BENCH_NAME)
+    train = crud.TrainCRUD.create_train(db, BENCH_TRAIN_NUMBER, datetime.now())
+    return train.id, uniform_id, activity_id
+
+
+def _worker_records(train_id, uniform_id, count):
+    base = datetime.now()
+    for i in range(count):
+        yield {
+            "train_id": train_id,
+            "uniform_id": uniform_id,
+            "helmet_on": i % 2 == 0,
+            "appearance_time": base + timedelta(seconds=i),
+            "disappearance_time": None,
+        }
+
+
+def _activity_records(worker_ids, activity_id, count):
+    # Открытые активности не меняют накопленные итоги mean_working_time
+    base = datetime.now()
+    for i in range(count):
+        yield {
+            "worker_id": worker_ids[i % len(worker_ids)],
+            "activity_id": activity_id,
+            "start_time": base + timedelta(seconds=i),
+            "end_time": None,
+        }
+
+
+def _alert_records(worker_ids, count):
+    base = datetime.now()
+    for i in range(count):
+        yield {
+            "worker_id": worker_ids[i % len(worker_ids)],
+            "alert_type": BENCH_NAME,
+            "danger_message": "Запись бенчмарка",
+            "alert_time": base + timedelta(seconds=i),
+        }
+
+
+def _rate(call, count):
+    started = time.perf_counter()
+    call()
+    return count / (time.perf_counter() - started)
+
+
+def bench_table(db, create_one, bulk_create, records, count):
+    """
+    Замеры для одной таблицы: create_* по одной строке (add + commit + refresh)
+    и bulk_create_* (многострочный INSERT на пачку и один commit) без id и с id
+    """
+    def per_row():
+        for record in records(count):
+            create_one(db, **record)
+
+    return [
+        (f"{create_one.__name__} (по одной)", _rate(per_row, count)),
+        (bulk_create.__name__, _rate(lambda: bulk_create(db, records(count)), count)),
+        (f"{bulk_create.__name__} + id", _rate(lambda: bulk_create(db, records(count), return_ids=True), count)),
+    ]
+
+
+def _cleanup(db):
+    """Удаляет тестовый поезд (работники, активности и происшествия удаляются каскадом) и справочники"""
+    db.rollback()
+    db.query(models.Train).filter(models.Train.train_number == BENCH_TRAIN_NUMBER).delete()
+    db.query(models.Activity).filter(models.Activity.name == BENCH_NAME).delete()
+    db.query(models.Uniform).filter(models.Uniform.color == BENCH_NAME).delete()
+    db.commit()
+    crud.invalidate_reference_cache()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else ROWS
+    engine = get_engine(BENCH_DATABASE_URL)
+    create_tables(engine)
+    session = get_session(engine)
+
+    try:
+        train_id, uniform_id, activity_id = _prepare_refs(session)
+        worker_ids = crud.WorkerCRUD.bulk_create_workers(
+            session, _worker_records(train_id, uniform_id, 100), return_ids=True
+        )
+
+        results = [
+            ("workers", bench_table(session, crud.WorkerCRUD.create_worker,
+                                    crud.WorkerCRUD.bulk_create_workers,
+                                    lambda n: _worker_records(train_id, uniform_id, n), count)),
+            ("worker_activities", bench_table(session, crud.WorkerActivityCRUD.create_worker_activity,
+                                              crud.WorkerActivityCRUD.bulk_create_worker_activities,
+                                              lambda n: _activity_records(worker_ids, activity_id, n), count)),
+            ("alerts", bench_table(session, crud.AlertCRUD.create_alert,
+                                   crud.AlertCRUD.bulk_create_alerts,
+                                   lambda n: _alert_records(worker_ids, n), count)),
+        ]
+
+        print(f"Строк в замере: {count}")
+        for table, rates in results:
+            print()
+            print(f"{table}")
+            print(f"{'Способ':<45} {'строк/сек':>12}")
+            print("-" * 58)
+            for name, rate in rates:
+                print(f"{name:<45} {rate:>12.0f}")
+            print(f"Ускорение: x{rates[1][1] / rates[0][1]:.1f}")
+    finally:
+        _cleanup(session)
+        session.close()
+
+
+if __name__ == "__main__":
+    main()
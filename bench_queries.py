@@ -0,0 +1,209 @@
+from datetime import datetime, timedelta
+import json
+import statistics
+import subprocess
+import sys
+import time
+import pandas as pd
+from sqlalchemy import text
+from database import get_session, get_engine, create_tables, clear_all_data, BENCH_DATABASE_URL
+import crud
+import dashboard_sql
+import models
+import queries
+import synthetic
+
+# Размеры данных (количество поездов) по умолчанию и повторов каждого замера
+SIZES = (1000, 10000, 100000)
+REPEATS = 5
+# Конец сгенерированного периода: вместе с seed делает данные одинаковыми между запусками
+END_TIME = datetime(2024, 1, 1)
+
+# Файл с результатами в формате JSON
+OUTPUT_FILE = "bench_results.json"
+
+
+def _rows(result):
+    """Количество строк в результате вызова (для запросов со скалярным результатом - 1)"""
+    if isinstance(result, pd.DataFrame):
+        return len(result)
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return 0 if result is None else 1
+
+
+def _sample(db):
+    """Параметры замеров: реальные поезд, работник и окно последнего часа данных"""
+    end_time = db.query(models.Worker.appearance_time).order_by(models.Worker.appearance_time.desc()).limit(1).scalar()
+    train = db.query(models.Train).filter(models.Train.id > 0).order_by(models.Train.id.desc()).first()
+    worker_id = db.query(models.Worker.id).filter(models.Worker.train_id == train.id).limit(1).scalar()
+    return {
+        "end_time": end_time,
+        "start_time": end_time - timedelta(hours=1),
+        "train_id": train.id,
+        "train_number": train.train_number,
+        "worker_id": worker_id,
+    }
+
+
+def _crud_benchmarks(p):
+    return [
+        ("TrainCRUD.get_train", lambda db: crud.TrainCRUD.get_train(db, p["train_id"])),
+        ("TrainCRUD.get_trains_by_number", lambda db: crud.TrainCRUD.get_trains_by_number(db, p["train_number"])),
+        ("TrainCRUD.get_trains_in_time_range",
+         lambda db: crud.TrainCRUD.get_trains_in_time_range(db, p["start_time"], p["end_time"])),
+        ("WorkerCRUD.get_worker", lambda db: crud.WorkerCRUD.get_worker(db, p["worker_id"])),
+        ("WorkerCRUD.get_workers_by_train", lambda db: crud.WorkerCRUD.get_workers_by_train(db, p["train_id"])),
+        ("WorkerCRUD.get_workers_in_time_range",
+         lambda db: crud.WorkerCRUD.get_workers_in_time_range(db, p["start_time"], p["end_time"])),
+        ("WorkerActivityCRUD.get_worker_activities",
+         lambda db: crud.WorkerActivityCRUD.get_worker_activities(db, p["worker_id"])),
+        ("WorkerActivityCRUD.get_activities_in_time_range",
+         lambda db: crud.WorkerActivityCRUD.get_activities_in_time_range(db, p["start_time"], p["end_time"])),
+        ("AlertCRUD.get_alerts_by_worker", lambda db: crud.AlertCRUD.get_alerts_by_worker(db, p["worker_id"])),
+        ("AlertCRUD.get_alerts_by_type", lambda db: crud.AlertCRUD.get_alerts_by_type(db, "человек на путях")),
+        ("AlertCRUD.get_alerts_in_time_range",
+         lambda db: crud.AlertCRUD.get_alerts_in_time_range(db, p["start_time"], p["end_time"])),
+        ("MeanWorkingTimeHistoryCRUD.get_history_range",
+         lambda db: crud.MeanWorkingTimeHistoryCRUD.get_history_range(
+             db, p["end_time"] - timedelta(hours=24), p["end_time"])),
+        ("MeanWorkingTimeCRUD.calculate_and_update_all", crud.MeanWorkingTimeCRUD.calculate_and_update_all),
+    ]
+
+
+def _query_benchmarks(p):
+    return [
+        ("AnalysisQueries.find_workers_repairing_train",
+         lambda db: queries.AnalysisQueries.find_workers_repairing_train(
+             db, p["train_number"], p["start_time"] - timedelta(hours=23), p["end_time"])),
+        ("AnalysisQueries.calculate_activity_time_by_uniform",
+         lambda db: queries.AnalysisQueries.calculate_activity_time_by_uniform(db, "работает")),
+        ("AnalysisQueries.get_workers_presence_timeline",
+         lambda db: queries.AnalysisQueries.get_workers_presence_timeline(db, p["train_id"])),
+        ("AnalysisQueries.get_depot_presence_timeline",
+         lambda db: queries.AnalysisQueries.get_depot_presence_timeline(db)),
+        ("AnalysisQueries.calculate_helmet_usage_percentage",
+         lambda db: queries.AnalysisQueries.calculate_helmet_usage_percentage(db)),
+        ("AnalysisQueries.get_helmet_compliance",
+         lambda db: queries.AnalysisQueries.get_helmet_compliance(
+             db, p["end_time"] - timedelta(days=1), p["end_time"])),
+        ("AnalysisQueries.get_worker_activity_timeline",
+         lambda db: queries.AnalysisQueries.get_worker_activity_timeline(db, p["worker_id"])),
+        ("AnalysisQueries.get_busiest_trains", lambda db: queries.AnalysisQueries.get_busiest_trains(db)),
+        ("AnalysisQueries.get_activity_counts", lambda db: queries.AnalysisQueries.get_activity_counts(db)),
+        ("AnalysisQueries.get_uniform_counts", lambda db: queries.AnalysisQueries.get_uniform_counts(db)),
+        ("AnalysisQueries.calculate_activity_time_by_uniform[view]",
+         lambda db: queries.AnalysisQueries.calculate_activity_time_by_uniform(
+             db, "работает", max_staleness=timedelta(minutes=5))),
+        ("AnalysisQueries.get_busiest_trains[view]",
+         lambda db: queries.AnalysisQueries.get_busiest_trains(db, max_staleness=timedelta(minutes=5))),
+        ("AnalysisQueries.get_helmet_compliance[rollup]",
+         lambda db: queries.AnalysisQueries.get_helmet_compliance(
+             db, p["end_time"] - timedelta(days=1), p["end_time"], max_staleness=timedelta(minutes=5))),
+    ]
+
+
+def _dashboard_benchmarks(engine):
+    """Запросы load_data дашборда тем же путем: psycopg2-соединение и pd.read_sql_query"""
+    def run(sql, params=None):
+        def call(db):
+            connection = engine.raw_connection()
+            try:
+                return pd.read_sql_query(sql, connection, params=params)
+            finally:
+                connection.close()
+        return call
+
+    session = get_session(engine)
+    try:
+        latest_time = session.execute(text(dashboard_sql.LATEST_TIME_SQL)).scalar()
+    finally:
+        session.close()
+    return [
+        ("load_data.watermark", run(dashboard_sql.WATERMARK_SQL)),
+        ("load_data.latest_time", run(dashboard_sql.LATEST_TIME_SQL)),
+        ("load_data.activity_counts", run(dashboard_sql.ACTIVITY_COUNTS_SQL, {"latest_time": latest_time})),
+        ("load_data.uniform_counts", run(dashboard_sql.UNIFORM_COUNTS_SQL, {"latest_time": latest_time})),
+        ("load_data.mean_time", run(dashboard_sql.MEAN_TIME_SQL, dashboard_sql.history_params(24, 300))),
+        ("load_data.alerts", run(dashboard_sql.ALERTS_SQL)),
+    ]
+
+
+def _measure(engine, name, call, repeats):
+    """Время вызова в мс: первый прогон прогревает кэши и не учитывается"""
+    timings = []
+    rows = 0
+    session = get_session(engine)
+    try:
+        for attempt in range(repeats + 1):
+            started = time.perf_counter()
+            rows = _rows(call(session))
+            elapsed = (time.perf_counter() - started) * 1000
+            session.rollback()
+            if attempt:
+                timings.append(elapsed)
+    finally:
+        session.close()
+    return {
+        "name": name,
+        "rows": rows,
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "max_ms": max(timings),
+    }
+
+
+def bench_size(engine, trains: int, seed: int, end_time: datetime, repeats: int):
+    """Заполняет базу trains поездами, прибывшими до end_time, и замеряет все запросы"""
+    clear_all_data(engine)
+    create_tables(engine)
+
+    session = get_session(engine)
+    try:
+        started = time.perf_counter()
+        counts = synthetic.generate(session, trains, seed, end_time)
+        generate_seconds = time.perf_counter() - started
+        session.execute(text("ANALYZE"))
+        session.commit()
+        params = _sample(session)
+    finally:
+        session.close()
+
+    benchmarks = _crud_benchmarks(params) + _query_benchmarks(params) + _dashboard_benchmarks(engine)
+    results = []
+    for name, call in benchmarks:
+        result = _measure(engine, name, call, repeats)
+        print(f"{trains:>8} {name:<55} {result['median_ms']:>10.2f} мс {result['rows']:>8} строк")
+        results.append(result)
+    return {"trains": trains, "counts": counts, "generate_seconds": generate_seconds, "benchmarks": results}
+
+
+def _revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or list(SIZES)
+    # Отдельная база для замеров: перед каждым размером данные в ней удаляются
+    engine = get_engine(BENCH_DATABASE_URL)
+    create_tables(engine)
+
+    report = {
+        "revision": _revision(),
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "seed": synthetic.SEED,
+        "end_time": END_TIME.isoformat(),
+        "repeats": REPEATS,
+        "sizes": [bench_size(engine, trains, synthetic.SEED, END_TIME, REPEATS) for trains in sizes],
+    }
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as output:
+        json.dump(report, output, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {OUTPUT_FILE}")
+
+
+if __name__ == "__main__":
+    main()
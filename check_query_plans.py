@@ -0,0 +1,216 @@
+from datetime import datetime, timedelta
+import json
+import sys
+from sqlalchemy import event
+from database import get_session, get_engine, create_tables
+import crud
+import instrumentation
+import partitioning
+import queries
+
+# Таблицы, на которых запросы по времени не должны читаться полным сканированием
+LARGE_TABLES = ("workers", "worker_activities", "alerts", "trains")
+
+
+def _query_methods(start_time, end_time):
+    """Проверяемые методы: имя и вызов с сессией"""
+    return [
+        ("TrainCRUD.get_trains_in_time_range",
+         lambda db: crud.TrainCRUD.get_trains_in_time_range(db, start_time, end_time)),
+        ("WorkerCRUD.get_workers_in_time_range",
+         lambda db: crud.WorkerCRUD.get_workers_in_time_range(db, start_time, end_time)),
+        ("WorkerCRUD.get_workers_by_train",
+         lambda db: crud.WorkerCRUD.get_workers_by_train(db, 1)),
+        ("WorkerActivityCRUD.get_activities_in_time_range",
+         lambda db: crud.WorkerActivityCRUD.get_activities_in_time_range(db, start_time, end_time)),
+        ("WorkerActivityCRUD.get_worker_activities",
+         lambda db: crud.WorkerActivityCRUD.get_worker_activities(db, 1)),
+        ("AlertCRUD.get_alerts_by_worker",
+         lambda db: crud.AlertCRUD.get_alerts_by_worker(db, 1)),
+        ("AlertCRUD.get_alerts_in_time_range",
+         lambda db: crud.AlertCRUD.get_alerts_in_time_range(db, start_time, end_time)),
+        ("AlertCRUD.get_alerts_in_time_range_page",
+         lambda db: crud.AlertCRUD.get_alerts_in_time_range_page(
+             db, start_time, end_time, cursor=crud._encode_cursor(start_time, 0))),
+        ("AlertCRUD.get_alerts_by_type_page",
+         lambda db: crud.AlertCRUD.get_alerts_by_type_page(
+             db, "человек на путях", cursor=crud._encode_cursor(start_time, 0))),
+        ("AnalysisQueries.find_workers_repairing_train",
+         lambda db: queries.AnalysisQueries.find_workers_repairing_train(db, "ЭС1-001", start_time, end_time)),
+        ("AnalysisQueries.get_workers_presence_timeline",
+         lambda db: queries.AnalysisQueries.get_workers_presence_timeline(db, 1)),
+    ]
+
+
+def _seq_scans(plan):
+    """Имена таблиц, которые план читает полным сканированием"""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name"))
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def _relations(plan):
+    """Имена всех таблиц (и секций), которые читает план"""
+    found = [plan["Relation Name"]] if "Relation Name" in plan else []
+    for child in plan.get("Plans", []):
+        found.extend(_relations(child))
+    return found
+
+
+def _is_large(relation):
+    return any(relation == table or relation.startswith(f"{table}_p") for table in LARGE_TABLES)
+
+
+def _plan(connection, statement, parameters):
+    result = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters)
+    plan = result.scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return plan[0]["Plan"]
+
+
+def _large_seq_scans(connection, statement, parameters):
+    return [relation for relation in _seq_scans(_plan(connection, statement, parameters)) if _is_large(relation)]
+
+
+def _capture_selects(engine, session, call):
+    """Выполняет call(session) и возвращает его SELECT-запросы с параметрами"""
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        call(session)
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return captured
+
+
+def _pruning_methods(start_time, end_time):
+    """Запросы по периоду к секционируемым таблицам"""
+    return [
+        ("WorkerActivityCRUD.get_activities_in_time_range",
+         lambda db: crud.WorkerActivityCRUD.get_activities_in_time_range(db, start_time, end_time)),
+        ("AnalysisQueries.find_workers_repairing_train",
+         lambda db: queries.AnalysisQueries.find_workers_repairing_train(db, "ЭС1-001", start_time, end_time)),
+        ("AlertCRUD.get_alerts_in_time_range",
+         lambda db: crud.AlertCRUD.get_alerts_in_time_range(db, start_time, end_time)),
+    ]
+
+
+def check_partition_pruning(engine):
+    """
+    Проверяет по EXPLAIN, что запросы по периоду не читают секции, лежащие целиком после периода
+    (для alerts - и целиком до него). Секции worker_activities раньше периода не отсекаются:
+    активность, начавшаяся давно, может продолжаться в периоде
+    """
+    end_time = datetime.now()
+    start_time = end_time - timedelta(hours=1)
+    failures = []
+    session = get_session(engine)
+    try:
+        partitions = {table: partitioning.get_partitions(session, table)
+                      for table in partitioning.PARTITIONED_TABLES
+                      if partitioning.is_partitioned(session, table)}
+        if not partitions:
+            print("Секционированных таблиц нет, проверка отсечения секций пропущена")
+            return failures
+
+        for name, call in _pruning_methods(start_time, end_time):
+            captured = _capture_selects(engine, session, call)
+            scanned = set()
+            for statement, parameters in captured:
+                scanned.update(_relations(_plan(session.connection(), statement, parameters)))
+            read = [
+                (table, partition, partition_start, partition_end)
+                for table, table_partitions in partitions.items()
+                for partition, partition_start, partition_end in table_partitions
+                if partition in scanned
+            ]
+            excess = [
+                partition for table, partition, partition_start, partition_end in read
+                if partition_start > end_time or (table == "alerts" and partition_end <= start_time)
+            ]
+            status = "OK" if not excess else f"НЕТ ОТСЕЧЕНИЯ: {', '.join(sorted(excess))}"
+            print(f"{name:<50} секций прочитано: {len(read):<4} {status}")
+            if excess:
+                failures.append((name, excess))
+            session.rollback()
+    finally:
+        session.close()
+    return failures
+
+
+def check_plans(engine, strict: bool = False):
+    """
+    Выполняет каждый метод, перехватывает его SQL и строит два плана.
+    С настройками по умолчанию - выбирает ли планировщик индекс на текущих данных
+    (на маленьких таблицах полное сканирование бывает дешевле и допустимо).
+    С enable_seqscan = off - если полное сканирование большой таблицы остается,
+    для запроса нет подходящего индекса. strict=True считает ошибкой и выбор планировщика
+    """
+    end_time = datetime.now()
+    start_time = end_time - timedelta(hours=1)
+    failures = []
+    session = get_session(engine)
+    try:
+        for name, call in _query_methods(start_time, end_time):
+            captured = _capture_selects(engine, session, call)
+            connection = session.connection()
+            planned = [_large_seq_scans(connection, statement, parameters) for statement, parameters in captured]
+            connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            for (statement, parameters), planner_scans in zip(captured, planned):
+                scans = _large_seq_scans(connection, statement, parameters)
+                status = "OK" if not scans else f"НЕТ ИНДЕКСА: {', '.join(scans)}"
+                planner = "индекс" if not planner_scans else f"SEQ SCAN: {', '.join(planner_scans)}"
+                print(f"{name:<50} {status:<30} планировщик: {planner}")
+                if scans:
+                    failures.append((name, scans))
+                elif strict and planner_scans:
+                    failures.append((name, planner_scans))
+            session.rollback()
+    finally:
+        session.close()
+    return failures
+
+
+def check_explain_isolation(engine):
+    """
+    Проверяет, что ошибка EXPLAIN медленного запроса (instrumentation._explain)
+    не прерывает транзакцию пользователя: после нее в той же транзакции выполняется запрос
+    """
+    failures = []
+    session = get_session(engine)
+    try:
+        connection = session.connection()
+        cursor = connection.connection.cursor()
+        cursor.execute("SELECT 1")
+        plan = instrumentation._explain(cursor, "SELECT * FROM explain_isolation_missing_table", None)
+        try:
+            connection.exec_driver_sql("SELECT 1").scalar()
+            status = "OK"
+        except Exception as e:
+            status = f"ТРАНЗАКЦИЯ ПРЕРВАНА: {e}"
+            failures.append(("instrumentation._explain", [str(e)]))
+        print(f"{'instrumentation._explain (ошибка EXPLAIN)':<50} {status}")
+        if not plan.startswith("EXPLAIN не выполнен"):
+            failures.append(("instrumentation._explain", [plan]))
+    finally:
+        session.rollback()
+        session.close()
+    return failures
+
+
+if __name__ == "__main__":
+    engine = get_engine()
+    create_tables(engine)
+    # python check_query_plans.py strict - ошибка и тогда, когда планировщик не выбирает индекс
+    failures = check_plans(engine, strict="strict" in sys.argv[1:])
+    failures += check_partition_pruning(engine)
+    failures += check_explain_isolation(engine)
+    sys.exit(1 if failures else 0)
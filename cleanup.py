@@ -1,6 +1,14 @@
-from database import drop_tables, clear_all_data, get_engine, create_tables
+from database import drop_tables, clear_all_data, get_engine, create_tables, get_session
+import retention
+import partitioning
+import materialized
+from queries import AnalysisQueries
+from datetime import timedelta
 import sys
 
+# Виды интервалов helmet_compliance_rollup, обновляемые командой refresh-views
+HELMET_ROLLUP_BUCKETS = ("hour", "shift")
+
 def main():
     if len(sys.argv) > 1:
         command = sys.argv[1]
@@ -28,14 +36,68 @@ def main():
                 print("База данных полностью сброшена")
             else:
                 print("Операция отменена")
+        elif command == "retention":
+            confirm = input("Удалить устаревшие записи по политикам хранения? (y/n): ")
+            if confirm.lower() == 'y':
+                session = get_session(engine)
+                try:
+                    retention.apply_policies(session)
+                finally:
+                    session.close()
+            else:
+                print("Операция отменена")
+        elif command == "partition":
+            interval = sys.argv[2] if len(sys.argv) > 2 else "day"
+            session = get_session(engine)
+            try:
+                # Преобразование таблиц переименовывает и копирует рабочие данные - только с подтверждением.
+                # Создание будущих секций (запуск по расписанию) подтверждения не требует
+                unpartitioned = [table for table in partitioning.PARTITIONED_TABLES
+                                 if not partitioning.is_partitioned(session, table)]
+                session.rollback()
+                if unpartitioned:
+                    confirm = input(f"Преобразовать таблицы {', '.join(unpartitioned)} в секционированные "
+                                    f"с переносом данных? (y/n): ")
+                    if confirm.lower() != 'y':
+                        print("Операция отменена")
+                        return
+                for table in partitioning.PARTITIONED_TABLES:
+                    partitioning.enable_partitioning(session, table, interval)
+                    created = partitioning.ensure_partitions(session, table)
+                    session.commit()
+                    print(f"{table}: секционирование включено, создано новых секций: {created}")
+            except Exception as e:
+                session.rollback()
+                print(f"Ошибка при секционировании: {e}")
+            finally:
+                session.close()
+        elif command == "refresh-views":
+            session = get_session(engine)
+            try:
+                refreshed = materialized.refresh_materialized_views(session)
+                print(f"Обновлены представления: {refreshed}")
+                # Каждый интервал обновляется с момента прошлого обновления; занятые другим процессом пропускаются
+                rollups = [bucket for bucket in HELMET_ROLLUP_BUCKETS
+                           if AnalysisQueries.ensure_helmet_rollup_fresh(session, bucket, timedelta(0))]
+                print(f"Обновлена статистика касок: {rollups}")
+            except Exception as e:
+                session.rollback()
+                print(f"Ошибка при обновлении представлений: {e}")
+            finally:
+                session.close()
         else:
-            print("Неизвестная команда. Используйте: drop, clear или reset")
+            print("Неизвестная команда. Используйте: drop, clear, reset, retention, partition или refresh-views")
     else:
         print("Использование: python cleanup.py [command]")
         print("Команды:")
         print("  drop  - удалить все таблицы")
         print("  clear - очистить все данные (без удаления таблиц)")
         print("  reset - полный сброс базы данных")
+        print("  retention - удалить устаревшие записи по политикам хранения")
+        print("  partition [day|week] - секционировать worker_activities и alerts по времени")
+        print("                         и создать секции на будущее (запускать по расписанию)")
+        print("  refresh-views - обновить материализованные представления аналитических запросов")
+        print("                  и предагрегированную статистику касок (helmet_compliance_rollup)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,127 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+import crud
+
+# Разрыв между кадрами одного трека, который еще считается тем же интервалом
+GAP_TOLERANCE = timedelta(seconds=2)
+
+
+class _Track:
+    """Открытый интервал присутствия трека и его текущей активности"""
+
+    __slots__ = ("worker_id", "worker_activity_id", "activity_id",
+                 "last_seen", "helmet_on")
+
+    def __init__(self, worker_id, worker_activity_id, activity_id, moment, helmet_on):
+        self.worker_id = worker_id
+        self.worker_activity_id = worker_activity_id
+        self.activity_id = activity_id
+        self.last_seen = moment
+        self.helmet_on = helmet_on
+
+
+class TrackCoalescer:
+    """
+    Объединяет покадровые наблюдения трекера в интервалы перед записью в БД.
+    Последовательные кадры одного трека с разрывом не больше gap_tolerance продлевают
+    открытый интервал в памяти; в БД пишутся только открытие (create_worker /
+    create_worker_activity с пустым окончанием) и закрытие (close_worker /
+    close_worker_activity). Интервал закрывается временем последнего кадра.
+
+    helmet_on работника при закрытии - была ли каска хотя бы на одном кадре интервала.
+    Состояние треков и счетчик записей меняются только после commit: если запись не удалась,
+    трек остается открытым и закрывается повторно при следующем вызове
+    """
+
+    def __init__(self, db: Session, gap_tolerance: timedelta = GAP_TOLERANCE):
+        self.db = db
+        self.gap_tolerance = gap_tolerance
+        self._tracks = {}
+        self.observations = 0
+        self.writes = 0
+        self._pending_writes = 0
+
+    def __len__(self):
+        return len(self._tracks)
+
+    def worker_id(self, track_id):
+        """id открытой строки работника для трека (например, для записи происшествия)"""
+        track = self._tracks.get(track_id)
+        return track.worker_id if track else None
+
+    def observe(self, track_id, moment: datetime, train_id: int, uniform_id: int,
+                helmet_on: bool, activity_id: int):
+        """Наблюдение трека track_id на кадре moment"""
+        self.observations += 1
+        track = self._tracks.get(track_id)
+        if track is not None and moment - track.last_seen > self.gap_tolerance:
+            self._close(track_id)
+            track = None
+
+        if track is None:
+            with self._transaction():
+                track = self._open(moment, train_id, uniform_id, helmet_on, activity_id)
+            self._tracks[track_id] = track
+            return
+
+        if activity_id != track.activity_id:
+            with self._transaction():
+                self._close_activity(track)
+                worker_activity_id = self._open_activity(track.worker_id, activity_id, moment)
+            track.worker_activity_id = worker_activity_id
+            track.activity_id = activity_id
+        track.last_seen = moment
+        track.helmet_on = track.helmet_on or helmet_on
+
+    def expire(self, now: datetime):
+        """Закрывает треки, которых не было в кадре дольше gap_tolerance; вызывать на каждом кадре"""
+        expired = [track_id for track_id, track in self._tracks.items()
+                   if now - track.last_seen > self.gap_tolerance]
+        for track_id in expired:
+            self._close(track_id)
+        return expired
+
+    def close_all(self):
+        """Закрывает все открытые интервалы (остановка камеры)"""
+        for track_id in list(self._tracks):
+            self._close(track_id)
+
+    def stats(self):
+        """Количество наблюдений, записей в БД и во сколько раз записей меньше, чем кадров"""
+        return {
+            "observations": self.observations,
+            "writes": self.writes,
+            "open_tracks": len(self._tracks),
+            "reduction": self.observations / self.writes if self.writes else 0.0,
+        }
+
+    @contextmanager
+    def _transaction(self):
+        """unit_of_work, записи которого учитываются в writes только после commit"""
+        self._pending_writes = 0
+        with crud.unit_of_work(self.db):
+            yield
+        self.writes += self._pending_writes
+
+    def _open_activity(self, worker_id, activity_id, moment):
+        self._pending_writes += 1
+        return crud.WorkerActivityCRUD.create_worker_activity(self.db, worker_id, activity_id, moment).id
+
+    def _close_activity(self, track):
+        self._pending_writes += 1
+        crud.WorkerActivityCRUD.close_worker_activity(self.db, track.worker_activity_id, track.last_seen)
+
+    def _open(self, moment, train_id, uniform_id, helmet_on, activity_id):
+        self._pending_writes += 1
+        worker_id = crud.WorkerCRUD.create_worker(self.db, train_id, uniform_id, helmet_on, moment).id
+        worker_activity_id = self._open_activity(worker_id, activity_id, moment)
+        return _Track(worker_id, worker_activity_id, activity_id, moment, helmet_on)
+
+    def _close(self, track_id):
+        track = self._tracks[track_id]
+        with self._transaction():
+            self._close_activity(track)
+            self._pending_writes += 1
+            crud.WorkerCRUD.close_worker(self.db, track.worker_id, track.last_seen, track.helmet_on)
+        del self._tracks[track_id]
@@ -1,9 +1,259 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
-from typing import List, Optional
+from sqlalchemy import and_, or_, func, insert, text, tuple_, event
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import List, Optional, Iterable
+from itertools import islice
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+import base64
+import json
+import threading
+import time
+from lru import LRUCache
 import models
 
+# Размер пачки для массовой вставки по умолчанию
+BULK_BATCH_SIZE = 1000
+
+# Размер пачки при потоковом чтении серверным курсором
+STREAM_CHUNK_SIZE = 1000
+
+# Размер страницы по умолчанию для постраничного просмотра
+PAGE_SIZE = 50
+
+# ID вида деятельности "работает", по которому считается среднее время работы
+WORKING_ACTIVITY_ID = 1
+
+# Интервалы истории среднего времени работы
+HISTORY_BUCKETS = ("minute", "hour", "shift")
+SHIFT_START_HOUR = 8  # Начало первой смены
+SHIFT_HOURS = 12  # Длительность смены
+# Ограничение количества точек, возвращаемых для графика
+HISTORY_MAX_POINTS = 300
+# Инкрементальный путь обновляет историю не чаще, чем раз в этот интервал (и при смене интервала истории)
+HISTORY_SNAPSHOT_INTERVAL = timedelta(seconds=10)
+
+# Время жизни кэша "шаблон названия -> id видов деятельности" (секунды).
+# В своем процессе кэш сбрасывается сразу при изменении activities
+ACTIVITY_CACHE_TTL = 60
+_activity_ids_cache = {}
+_activity_cache_lock = threading.Lock()
+# Номер поколения кэша: растет при каждом сбросе, чтобы не сохранить результат, прочитанный до сброса
+_activity_cache_generation = 0
+
+
+# Максимальное количество значений в кэше каждого справочника (uniforms, activities)
+REFERENCE_CACHE_SIZE = 1024
+
+
+uniform_id_cache = LRUCache(REFERENCE_CACHE_SIZE)  # цвет униформы -> uniforms.id
+activity_id_cache = LRUCache(REFERENCE_CACHE_SIZE)  # название вида деятельности -> activities.id
+
+
+def _invalidate_activity_patterns():
+    global _activity_cache_generation
+    with _activity_cache_lock:
+        _activity_ids_cache.clear()
+        _activity_cache_generation += 1
+
+
+def invalidate_activity_cache():
+    """Сбрасывает кэш id видов деятельности"""
+    _invalidate_activity_patterns()
+    activity_id_cache.invalidate()
+
+
+def invalidate_reference_cache():
+    """Сбрасывает все кэши справочников (после изменения uniforms/activities в обход CRUD)"""
+    uniform_id_cache.invalidate()
+    invalidate_activity_cache()
+
+
+def invalidate_process_caches():
+    """Сбрасывает все кэши процесса, ссылающиеся на строки БД (после очистки или удаления таблиц)"""
+    global _history_last_snapshot
+    invalidate_reference_cache()
+    with _history_snapshot_lock:
+        _history_last_snapshot = None
+
+
+# Ключи в Session.info для режима единицы работы
+UNIT_OF_WORK_KEY = "unit_of_work"
+UNIT_OF_WORK_REFRESH_KEY = "unit_of_work_refresh"
+
+
+@contextmanager
+def unit_of_work(db: Session, refresh: bool = False):
+    """
+    Транзакционный режим для CRUD-методов: внутри блока методы только выполняют flush,
+    а commit выполняется один раз при выходе из блока (rollback - при ошибке).
+    refresh=True - перечитывать объекты после flush, если нужны значения по умолчанию из БД.
+    Вложенные блоки присоединяются к внешнему.
+    """
+    if db.info.get(UNIT_OF_WORK_KEY):
+        yield db
+        return
+
+    db.info[UNIT_OF_WORK_KEY] = True
+    db.info[UNIT_OF_WORK_REFRESH_KEY] = refresh
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.info.pop(UNIT_OF_WORK_KEY, None)
+        db.info.pop(UNIT_OF_WORK_REFRESH_KEY, None)
+
+
+# Ключ в Session.info: действия, которые выполняются только после commit транзакции
+ON_COMMIT_KEY = "on_commit"
+
+
+def _on_commit(db: Session, callback):
+    """Откладывает callback() до успешного commit текущей транзакции; при rollback он отбрасывается"""
+    db.info.setdefault(ON_COMMIT_KEY, []).append(callback)
+
+
+@event.listens_for(Session, "after_commit")
+def _run_on_commit(session):
+    for callback in session.info.pop(ON_COMMIT_KEY, []):
+        callback()
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_on_commit(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(ON_COMMIT_KEY, None)
+
+
+def _commit(db: Session):
+    """commit в обычном режиме, flush - в режиме единицы работы"""
+    if db.info.get(UNIT_OF_WORK_KEY):
+        db.flush()
+    else:
+        db.commit()
+
+
+def _save(db: Session, obj):
+    """Сохраняет объект: add + commit + refresh, либо только flush в режиме единицы работы"""
+    db.add(obj)
+    if db.info.get(UNIT_OF_WORK_KEY):
+        db.flush()
+        if db.info.get(UNIT_OF_WORK_REFRESH_KEY):
+            db.refresh(obj)
+    else:
+        db.commit()
+        db.refresh(obj)
+    return obj
+
+
+def _get_or_create_id(db: Session, cache: LRUCache, model, key_column: str, key, values: dict,
+                      on_create=None):
+    """
+    id строки справочника по уникальному значению: из кэша, иначе
+    INSERT ... ON CONFLICT DO NOTHING RETURNING id, а при конфликте - SELECT.
+    on_create() вызывается после commit, если строка была создана
+    """
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    statement = pg_insert(model).values(**{key_column: key}, **values)
+    statement = statement.on_conflict_do_nothing(index_elements=[key_column]).returning(model.id)
+    row_id = db.execute(statement).scalar()
+    created = row_id is not None
+    if not created:
+        row_id = db.query(model.id).filter(getattr(model, key_column) == key).scalar()
+    elif on_create:
+        _on_commit(db, on_create)
+    # id попадает в кэш только после commit: до него транзакция (в том числе внешняя
+    # единица работы, где строка могла быть создана ранее) еще может откатиться
+    _on_commit(db, lambda: cache.put(key, row_id))
+    _commit(db)
+    return row_id
+
+
+def _stream(query, chunk_size: int = STREAM_CHUNK_SIZE):
+    """Выполняет ORM-запрос серверным курсором и отдает результаты по одному, читая пачками"""
+    yield from query.yield_per(chunk_size)
+
+
+def stream_rows(db: Session, statement, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Выполняет запрос (select по столбцам) серверным курсором и отдает легкие кортежи-строки,
+    не загружая весь результат в память
+    """
+    result = db.execute(statement, execution_options={"stream_results": True, "yield_per": chunk_size})
+    try:
+        yield from result
+    finally:
+        result.close()
+
+
+def _encode_cursor(moment: datetime, row_id: int) -> str:
+    payload = json.dumps([moment.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        moment, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(moment), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Некорректный курсор страницы: {cursor}") from e
+
+
+def _keyset_page(query, time_column, id_column, page_size: int, cursor: str = None):
+    """
+    Страница результатов по ключу (time_column, id_column) вместо OFFSET:
+    стоимость не зависит от номера страницы. Возвращает (строки, курсор следующей страницы или None)
+    """
+    if cursor is not None:
+        query = query.filter(tuple_(time_column, id_column) > tuple_(*_decode_cursor(cursor)))
+    rows = query.order_by(None).order_by(time_column, id_column).limit(page_size + 1).all()
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, _encode_cursor(getattr(last, time_column.key), getattr(last, id_column.key))
+
+
+def _chunked(records: Iterable[dict], size: int):
+    """Разбивает поток записей на списки длиной не более size"""
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _bulk_insert(db: Session, model, records: Iterable[dict],
+                 batch_size: int = BULK_BATCH_SIZE, return_ids: bool = False, after_chunk=None):
+    """
+    Массовая вставка записей: один многострочный INSERT на пачку и один commit в конце.
+    При return_ids=True возвращает список сгенерированных id в порядке входных записей.
+    after_chunk(db, chunk, chunk_ids) вызывается после вставки каждой пачки в той же транзакции.
+    """
+    ids = []
+    try:
+        for chunk in _chunked(records, batch_size):
+            if return_ids or after_chunk:
+                chunk_ids = list(db.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), chunk))
+                if after_chunk:
+                    after_chunk(db, chunk, chunk_ids)
+                if return_ids:
+                    ids.extend(chunk_ids)
+            else:
+                db.execute(insert(model), chunk)
+        _commit(db)
+    except Exception:
+        db.rollback()
+        raise
+    return ids if return_ids else None
+
 # CRUD операции для Train
 class TrainCRUD:
     @staticmethod
@@ -13,27 +263,51 @@ class TrainCRUD:
             arrival_time=arrival_time,
             departure_time=departure_time  # Может быть None
         )
-        db.add(db_train)
-        db.commit()
-        db.refresh(db_train)
-        return db_train
+        return _save(db, db_train)
+
+    @staticmethod
+    def bulk_create_trains(db: Session, records: Iterable[dict],
+                           batch_size: int = BULK_BATCH_SIZE, return_ids: bool = False):
+        """
+        Массовое создание поездов. Каждая запись - словарь с ключами
+        train_number, arrival_time, departure_time
+        """
+        return _bulk_insert(db, models.Train, records, batch_size, return_ids)
 
     @staticmethod
     def get_train(db: Session, train_id: int):
         return db.query(models.Train).filter(models.Train.id == train_id).first()
 
+    @staticmethod
+    def _trains_by_number_query(db: Session, train_number: str):
+        return db.query(models.Train).filter(models.Train.train_number == train_number)
+
     @staticmethod
     def get_trains_by_number(db: Session, train_number: str):
-        return db.query(models.Train).filter(models.Train.train_number == train_number).all()
+        return TrainCRUD._trains_by_number_query(db, train_number).all()
 
     @staticmethod
-    def get_trains_in_time_range(db: Session, start_time: datetime, end_time: datetime):
+    def iter_trains_by_number(db: Session, train_number: str, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Потоковый вариант get_trains_by_number: строки читаются серверным курсором пачками по chunk_size"""
+        return _stream(TrainCRUD._trains_by_number_query(db, train_number), chunk_size)
+
+    @staticmethod
+    def _trains_in_time_range_query(db: Session, start_time: datetime, end_time: datetime):
         return db.query(models.Train).filter(
             and_(
-                models.Train.arrival_time <= end_time,
-                models.Train.departure_time >= start_time
+                models.overlaps(models.Train.arrival_time, models.Train.departure_time, start_time, end_time),
+                models.Train.departure_time.isnot(None)
             )
-        ).all()
+        )
+
+    @staticmethod
+    def get_trains_in_time_range(db: Session, start_time: datetime, end_time: datetime):
+        return TrainCRUD._trains_in_time_range_query(db, start_time, end_time).all()
+
+    @staticmethod
+    def iter_trains_in_time_range(db: Session, start_time: datetime, end_time: datetime, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Потоковый вариант get_trains_in_time_range: строки читаются серверным курсором пачками по chunk_size"""
+        return _stream(TrainCRUD._trains_in_time_range_query(db, start_time, end_time), chunk_size)
 
 
 # CRUD операции для Uniform
@@ -41,10 +315,7 @@ class UniformCRUD:
     @staticmethod
     def create_uniform(db: Session, color: str):
         db_uniform = models.Uniform(color=color)
-        db.add(db_uniform)
-        db.commit()
-        db.refresh(db_uniform)
-        return db_uniform
+        return _save(db, db_uniform)
 
     @staticmethod
     def get_uniform(db: Session, uniform_id: int):
@@ -54,16 +325,42 @@ class UniformCRUD:
     def get_uniform_by_color(db: Session, color: str):
         return db.query(models.Uniform).filter(models.Uniform.color == color).first()
 
+    @staticmethod
+    def get_or_create_uniform_id(db: Session, color: str) -> int:
+        """id униформы по цвету; создает униформу, если ее нет. Повторные вызовы не обращаются к БД"""
+        return _get_or_create_id(db, uniform_id_cache, models.Uniform, "color", color, {})
+
 
 # CRUD операции для Activity
 class ActivityCRUD:
     @staticmethod
     def create_activity(db: Session, name: str, description: str = None):
         db_activity = models.Activity(name=name, description=description)
-        db.add(db_activity)
-        db.commit()
-        db.refresh(db_activity)
-        return db_activity
+        # Сброс после commit: иначе параллельное чтение успеет закэшировать данные до изменения
+        _on_commit(db, invalidate_activity_cache)
+        return _save(db, db_activity)
+
+    @staticmethod
+    def resolve_activity_ids(db: Session, name_pattern: str):
+        """
+        id видов деятельности, название которых подходит под шаблон ILIKE (например '%чинит%').
+        Результат кэшируется, чтобы частые запросы фильтровали activity_id IN (...) без join с activities
+        """
+        now = time.monotonic()
+        with _activity_cache_lock:
+            cached = _activity_ids_cache.get(name_pattern)
+            generation = _activity_cache_generation
+        if cached and now - cached[0] < ACTIVITY_CACHE_TTL:
+            return cached[1]
+
+        ids = tuple(activity_id for (activity_id,) in db.query(models.Activity.id).filter(
+            models.Activity.name.ilike(name_pattern)
+        ).order_by(models.Activity.id))
+        with _activity_cache_lock:
+            # Если кэш сбросили во время запроса, результат мог устареть - не сохраняем его
+            if generation == _activity_cache_generation:
+                _activity_ids_cache[name_pattern] = (now, ids)
+        return ids
 
     @staticmethod
     def get_activity(db: Session, activity_id: int):
@@ -73,6 +370,13 @@ class ActivityCRUD:
     def get_activity_by_name(db: Session, name: str):
         return db.query(models.Activity).filter(models.Activity.name == name).first()
 
+    @staticmethod
+    def get_or_create_activity_id(db: Session, name: str, description: str = None) -> int:
+        """id вида деятельности по названию; создает его, если его нет. Повторные вызовы не обращаются к БД"""
+        # Новый вид деятельности может подойти под закэшированные шаблоны названий: сброс после commit
+        return _get_or_create_id(db, activity_id_cache, models.Activity, "name", name, {"description": description},
+                                 on_create=_invalidate_activity_patterns)
+
 
 # CRUD операции для Worker
 class WorkerCRUD:
@@ -85,27 +389,76 @@ class WorkerCRUD:
             appearance_time=appearance_time,
             disappearance_time=disappearance_time  # Может быть None
         )
-        db.add(db_worker)
-        db.commit()
-        db.refresh(db_worker)
-        return db_worker
+        return _save(db, db_worker)
 
     @staticmethod
     def get_worker(db: Session, worker_id: int):
         return db.query(models.Worker).filter(models.Worker.id == worker_id).first()
 
+    @staticmethod
+    def close_worker(db: Session, worker_id: int, disappearance_time: datetime, helmet_on: bool = None):
+        """Фиксирует уход работника из кадра; helmet_on - итоговое значение за интервал, если известно"""
+        db_worker = db.query(models.Worker).filter(
+            and_(
+                models.Worker.id == worker_id,
+                models.Worker.disappearance_time.is_(None)
+            )
+        ).first()
+        if not db_worker:
+            return None
+
+        db_worker.disappearance_time = disappearance_time
+        if helmet_on is not None:
+            db_worker.helmet_on = helmet_on
+        _commit(db)
+        return db_worker
+
+    @staticmethod
+    def bulk_create_workers(db: Session, records: Iterable[dict],
+                            batch_size: int = BULK_BATCH_SIZE, return_ids: bool = False):
+        """
+        Массовое создание работников. Каждая запись - словарь с ключами
+        train_id, uniform_id, helmet_on, appearance_time, disappearance_time
+        """
+        return _bulk_insert(db, models.Worker, records, batch_size, return_ids)
+
+    @staticmethod
+    def _workers_by_train_query(db: Session, train_id: int):
+        return db.query(models.Worker).filter(models.Worker.train_id == train_id)
+
     @staticmethod
     def get_workers_by_train(db: Session, train_id: int):
-        return db.query(models.Worker).filter(models.Worker.train_id == train_id).all()
+        return WorkerCRUD._workers_by_train_query(db, train_id).all()
 
     @staticmethod
-    def get_workers_in_time_range(db: Session, start_time: datetime, end_time: datetime):
+    def iter_workers_by_train(db: Session, train_id: int, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Потоковый вариант get_workers_by_train: строки читаются серверным курсором пачками по chunk_size"""
+        return _stream(WorkerCRUD._workers_by_train_query(db, train_id), chunk_size)
+
+    @staticmethod
+    def _workers_in_time_range_query(db: Session, start_time: datetime, end_time: datetime):
         return db.query(models.Worker).filter(
             and_(
-                models.Worker.appearance_time <= end_time,
-                models.Worker.disappearance_time >= start_time
+                models.overlaps(models.Worker.appearance_time, models.Worker.disappearance_time, start_time, end_time),
+                models.Worker.disappearance_time.isnot(None)
             )
-        ).all()
+        )
+
+    @staticmethod
+    def get_workers_in_time_range(db: Session, start_time: datetime, end_time: datetime):
+        return WorkerCRUD._workers_in_time_range_query(db, start_time, end_time).all()
+
+    @staticmethod
+    def get_workers_in_time_range_page(db: Session, start_time: datetime, end_time: datetime,
+                                       page_size: int = PAGE_SIZE, cursor: str = None):
+        """Страница работников за период по (appearance_time, id); cursor - из предыдущего вызова"""
+        return _keyset_page(WorkerCRUD._workers_in_time_range_query(db, start_time, end_time),
+                            models.Worker.appearance_time, models.Worker.id, page_size, cursor)
+
+    @staticmethod
+    def iter_workers_in_time_range(db: Session, start_time: datetime, end_time: datetime, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Потоковый вариант get_workers_in_time_range: строки читаются серверным курсором пачками по chunk_size"""
+        return _stream(WorkerCRUD._workers_in_time_range_query(db, start_time, end_time), chunk_size)
 
 
 # CRUD операции для WorkerActivity
@@ -119,37 +472,365 @@ class WorkerActivityCRUD:
             start_time=start_time,
             end_time=end_time  # Может быть None
         )
-        db.add(db_activity)
-        db.commit()
-        db.refresh(db_activity)
+        if end_time is not None and activity_id == WORKING_ACTIVITY_ID:
+            # Закрытая активность "работает" сразу учитывается в накопленных итогах
+            db.add(db_activity)
+            db.flush()
+            _apply_closed_working_activities(db, [db_activity.id])
+        return _save(db, db_activity)
+
+    @staticmethod
+    def close_worker_activity(db: Session, worker_activity_id: int, end_time: datetime):
+        """Закрывает открытую активность и обновляет накопленные итоги среднего времени работы"""
+        db_activity = db.query(models.WorkerActivity).filter(
+            and_(
+                models.WorkerActivity.id == worker_activity_id,
+                models.WorkerActivity.end_time.is_(None)
+            )
+        ).first()
+        if not db_activity:
+            return None
+
+        db_activity.end_time = end_time
+        db.flush()
+        if db_activity.activity_id == WORKING_ACTIVITY_ID:
+            _apply_closed_working_activities(db, [db_activity.id])
+        _commit(db)
         return db_activity
 
     @staticmethod
-    def get_worker_activities(db: Session, worker_id: int):
+    def bulk_create_worker_activities(db: Session, records: Iterable[dict],
+                                      batch_size: int = BULK_BATCH_SIZE, return_ids: bool = False):
+        """
+        Массовое создание активностей работников. Каждая запись - словарь с ключами
+        worker_id, activity_id, start_time, end_time
+        """
+        def apply_closed(db, chunk, chunk_ids):
+            closed_ids = [
+                activity_id for record, activity_id in zip(chunk, chunk_ids)
+                if record.get("end_time") is not None and record["activity_id"] == WORKING_ACTIVITY_ID
+            ]
+            if closed_ids:
+                _apply_closed_working_activities(db, closed_ids)
+
+        return _bulk_insert(db, models.WorkerActivity, records, batch_size, return_ids, after_chunk=apply_closed)
+
+    @staticmethod
+    def _worker_activities_query(db: Session, worker_id: int):
         return db.query(models.WorkerActivity).filter(
             models.WorkerActivity.worker_id == worker_id
-        ).all()
+        )
 
     @staticmethod
-    def get_activities_in_time_range(db: Session, start_time: datetime, end_time: datetime):
+    def get_worker_activities(db: Session, worker_id: int):
+        return WorkerActivityCRUD._worker_activities_query(db, worker_id).all()
+
+    @staticmethod
+    def iter_worker_activities(db: Session, worker_id: int, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Потоковый вариант get_worker_activities: строки читаются серверным курсором пачками по chunk_size"""
+        return _stream(WorkerActivityCRUD._worker_activities_query(db, worker_id), chunk_size)
+
+    @staticmethod
+    def _activities_in_time_range_query(db: Session, start_time: datetime, end_time: datetime):
         return db.query(models.WorkerActivity).filter(
             and_(
-                models.WorkerActivity.start_time <= end_time,
-                models.WorkerActivity.end_time >= start_time
+                models.overlaps(models.WorkerActivity.start_time, models.WorkerActivity.end_time, start_time, end_time),
+                models.WorkerActivity.end_time.isnot(None)
             )
-        ).all()
+        )
+
+    @staticmethod
+    def get_activities_in_time_range(db: Session, start_time: datetime, end_time: datetime):
+        return WorkerActivityCRUD._activities_in_time_range_query(db, start_time, end_time).all()
+
+    @staticmethod
+    def get_activities_in_time_range_page(db: Session, start_time: datetime, end_time: datetime,
+                                          page_size: int = PAGE_SIZE, cursor: str = None):
+        """Страница активностей за период по (start_time, id); cursor - из предыдущего вызова"""
+        return _keyset_page(WorkerActivityCRUD._activities_in_time_range_query(db, start_time, end_time),
+                            models.WorkerActivity.start_time, models.WorkerActivity.id, page_size, cursor)
+
+    @staticmethod
+    def iter_activities_in_time_range(db: Session, start_time: datetime, end_time: datetime, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Потоковый вариант get_activities_in_time_range: строки читаются серверным курсором пачками по chunk_size"""
+        return _stream(WorkerActivityCRUD._activities_in_time_range_query(db, start_time, end_time), chunk_size)
+
+# Прибавляет закрытые активности "работает" к накопленным итогам по униформам.
+# Работник учитывается в worker_count только при закрытии его первой такой активности
+_APPLY_CLOSED_ACTIVITIES_SQL = text("""
+    INSERT INTO mean_working_time
+        (uniform_id, total_seconds, activity_count, worker_count, mean_seconds, last_updated)
+    SELECT
+        w.uniform_id,
+        sum(extract(epoch FROM wa.end_time - wa.start_time))::bigint,
+        count(*),
+        count(DISTINCT wa.worker_id) FILTER (WHERE NOT EXISTS (
+            SELECT 1 FROM worker_activities prev
+            WHERE prev.worker_id = wa.worker_id
+              AND prev.activity_id = :working_activity_id
+              AND prev.end_time IS NOT NULL
+              AND prev.id <> ALL(:ids)
+        )),
+        (sum(extract(epoch FROM wa.end_time - wa.start_time)) / count(*))::integer,
+        :now
+    FROM worker_activities wa
+    JOIN workers w ON w.id = wa.worker_id
+    WHERE wa.id = ANY(:ids)
+      AND wa.activity_id = :working_activity_id
+      AND wa.end_time IS NOT NULL
+    GROUP BY w.uniform_id
+    ON CONFLICT (uniform_id) DO UPDATE SET
+        total_seconds = mean_working_time.total_seconds + EXCLUDED.total_seconds,
+        activity_count = mean_working_time.activity_count + EXCLUDED.activity_count,
+        worker_count = mean_working_time.worker_count + EXCLUDED.worker_count,
+        mean_seconds = (mean_working_time.total_seconds + EXCLUDED.total_seconds)
+                       / (mean_working_time.activity_count + EXCLUDED.activity_count),
+        last_updated = EXCLUDED.last_updated
+""")
+
+# Вычитает удаляемые активности "работает" из накопленных итогов по униформам.
+# Работник вычитается из worker_count, если у него не остается других закрытых таких активностей
+_SUBTRACT_ACTIVITIES_SQL = text("""
+    UPDATE mean_working_time m SET
+        total_seconds = m.total_seconds - d.total_seconds,
+        activity_count = m.activity_count - d.activity_count,
+        worker_count = m.worker_count - d.worker_count,
+        mean_seconds = COALESCE((m.total_seconds - d.total_seconds)
+                                / NULLIF(m.activity_count - d.activity_count, 0), 0),
+        last_updated = :now
+    FROM (
+        SELECT
+            w.uniform_id,
+            sum(extract(epoch FROM wa.end_time - wa.start_time))::bigint AS total_seconds,
+            count(*) AS activity_count,
+            count(DISTINCT wa.worker_id) FILTER (WHERE NOT EXISTS (
+                SELECT 1 FROM worker_activities rest
+                WHERE rest.worker_id = wa.worker_id
+                  AND rest.activity_id = :working_activity_id
+                  AND rest.end_time IS NOT NULL
+                  AND rest.id <> ALL(:ids)
+            )) AS worker_count
+        FROM worker_activities wa
+        JOIN workers w ON w.id = wa.worker_id
+        WHERE wa.id = ANY(:ids)
+          AND wa.activity_id = :working_activity_id
+          AND wa.end_time IS NOT NULL
+        GROUP BY w.uniform_id
+    ) d
+    WHERE m.uniform_id = d.uniform_id
+""")
+
+# Полный пересчет итогов по всей истории (сверка)
+_RECALCULATE_ALL_SQL = text("""
+    INSERT INTO mean_working_time
+        (uniform_id, total_seconds, activity_count, worker_count, mean_seconds, last_updated)
+    SELECT
+        w.uniform_id,
+        sum(extract(epoch FROM wa.end_time - wa.start_time))::bigint,
+        count(*),
+        count(DISTINCT wa.worker_id),
+        (sum(extract(epoch FROM wa.end_time - wa.start_time)) / count(*))::integer,
+        :now
+    FROM worker_activities wa
+    JOIN workers w ON w.id = wa.worker_id
+    WHERE wa.activity_id = :working_activity_id
+      AND wa.end_time IS NOT NULL
+    GROUP BY w.uniform_id
+    ON CONFLICT (uniform_id) DO UPDATE SET
+        total_seconds = EXCLUDED.total_seconds,
+        activity_count = EXCLUDED.activity_count,
+        worker_count = EXCLUDED.worker_count,
+        mean_seconds = EXCLUDED.mean_seconds,
+        last_updated = EXCLUDED.last_updated
+""")
+
+
+# При полном пересчете униформы без закрытых активностей "работает" обнуляются:
+# иначе у униформы, потерявшей все строки, навсегда остались бы старые итоги
+_RESET_MISSING_SQL = text("""
+    UPDATE mean_working_time SET
+        total_seconds = 0,
+        activity_count = 0,
+        worker_count = 0,
+        mean_seconds = 0,
+        last_updated = :now
+    WHERE activity_count <> 0
+      AND uniform_id NOT IN (
+        SELECT w.uniform_id
+        FROM worker_activities wa
+        JOIN workers w ON w.id = wa.worker_id
+        WHERE wa.activity_id = :working_activity_id
+          AND wa.end_time IS NOT NULL
+    )
+""")
+
+
+# Снимок текущих значений mean_working_time в историю за интервал (последнее значение в интервале)
+_SNAPSHOT_HISTORY_SQL = text("""
+    INSERT INTO mean_working_time_history
+        (uniform_id, bucket, bucket_start, mean_seconds, worker_count, activity_count)
+    SELECT uniform_id, :bucket, :bucket_start, mean_seconds, worker_count, activity_count
+    FROM mean_working_time
+    ON CONFLICT (uniform_id, bucket, bucket_start) DO UPDATE SET
+        mean_seconds = EXCLUDED.mean_seconds,
+        worker_count = EXCLUDED.worker_count,
+        activity_count = EXCLUDED.activity_count
+""")
+
+# Чтение истории за период с прореживанием до шага step секунд.
+# Среднее по униформам взвешивается количеством активностей.
+# Этот же запрос выполняет дашборд (dashboard_sql.MEAN_TIME_SQL)
+HISTORY_RANGE_SQL = text("""
+    SELECT
+        CAST(:start_time AS timestamp)
+            + floor(extract(epoch FROM bucket_start - CAST(:start_time AS timestamp)) / :step)
+            * :step * interval '1 second' AS point_time,
+        (sum(mean_seconds::bigint * activity_count) / NULLIF(sum(activity_count), 0))::integer AS mean_seconds,
+        sum(activity_count)::integer AS activity_count
+    FROM mean_working_time_history
+    WHERE bucket = :bucket
+      AND bucket_start >= :start_time
+      AND bucket_start <= :end_time
+      AND (CAST(:uniform_id AS integer) IS NULL OR uniform_id = :uniform_id)
+    GROUP BY point_time
+    ORDER BY point_time
+""")
+
+_BUCKET_SECONDS = {"minute": 60, "hour": 3600, "shift": SHIFT_HOURS * 3600}
+
+# Время последнего снимка истории, записанного инкрементальным путем в этом процессе
+_history_last_snapshot = None
+_history_snapshot_lock = threading.Lock()
+
+
+def bucket_start(moment: datetime, bucket: str) -> datetime:
+    """Начало интервала истории, в который попадает moment"""
+    if bucket == "minute":
+        return moment.replace(second=0, microsecond=0)
+    if bucket == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if bucket == "shift":
+        first_shift = moment.replace(hour=SHIFT_START_HOUR, minute=0, second=0, microsecond=0)
+        if moment < first_shift:
+            first_shift -= timedelta(days=1)
+        shifts_passed = int((moment - first_shift) / timedelta(hours=SHIFT_HOURS))
+        return first_shift + timedelta(hours=SHIFT_HOURS * shifts_passed)
+    raise ValueError(f"Неизвестный интервал истории: {bucket}")
+
+
+def _snapshot_history(db: Session, moment: datetime):
+    """Записывает текущие значения mean_working_time в историю по всем интервалам, без commit"""
+    for bucket in HISTORY_BUCKETS:
+        db.execute(_SNAPSHOT_HISTORY_SQL, {"bucket": bucket, "bucket_start": bucket_start(moment, bucket)})
+
+
+def _remember_history_snapshot(moment: datetime):
+    global _history_last_snapshot
+    with _history_snapshot_lock:
+        if _history_last_snapshot is None or moment > _history_last_snapshot:
+            _history_last_snapshot = moment
+
+
+def _crossed_buckets(previous: datetime, moment: datetime) -> bool:
+    return any(bucket_start(previous, bucket) != bucket_start(moment, bucket) for bucket in HISTORY_BUCKETS)
+
+
+def _close_previous_history_buckets(db: Session, moment: datetime):
+    """
+    Перед изменением итогов в новом интервале дописывает в интервалы последнего снимка
+    их итоговые значения (изменения, пропущенные из-за HISTORY_SNAPSHOT_INTERVAL), без commit
+    """
+    with _history_snapshot_lock:
+        previous = _history_last_snapshot
+    if previous is not None and _crossed_buckets(previous, moment):
+        _snapshot_history(db, previous)
+
+
+def _snapshot_history_throttled(db: Session, moment: datetime):
+    """
+    Записывает текущие итоги в историю (последнее значение в интервале, как и полный пересчет),
+    но не чаще раза в HISTORY_SNAPSHOT_INTERVAL, если интервалы не сменились. Без commit
+    """
+    with _history_snapshot_lock:
+        previous = _history_last_snapshot
+    recent = previous is not None and moment - previous < HISTORY_SNAPSHOT_INTERVAL
+    if recent and not _crossed_buckets(previous, moment):
+        return
+    _snapshot_history(db, moment)
+    _on_commit(db, lambda: _remember_history_snapshot(moment))
+
+
+def history_step(start_time: datetime, end_time: datetime, bucket: str = "minute",
+                 max_points: int = HISTORY_MAX_POINTS) -> int:
+    """Шаг прореживания истории в секундах: не больше max_points точек за период, кратно интервалу"""
+    bucket_seconds = _BUCKET_SECONDS[bucket]
+    window_seconds = max((end_time - start_time).total_seconds(), bucket_seconds)
+    return bucket_seconds * max(1, -(-int(window_seconds // bucket_seconds) // max_points))
+
+
+def _apply_closed_working_activities(db: Session, worker_activity_ids: List[int]):
+    """Обновляет накопленные итоги одним запросом и историю (с ограничением частоты), без commit"""
+    now = datetime.now()
+    _close_previous_history_buckets(db, now)
+    db.execute(_APPLY_CLOSED_ACTIVITIES_SQL, {
+        "ids": list(worker_activity_ids),
+        "working_activity_id": WORKING_ACTIVITY_ID,
+        "now": now
+    })
+    _snapshot_history_throttled(db, now)
+
+
+def subtract_deleted_activities(db: Session, worker_activity_ids: List[int]):
+    """
+    Вычитает активности из накопленных итогов перед их удалением (хранение данных), без commit.
+    Вызывается в той же транзакции, что и DELETE
+    """
+    if not worker_activity_ids:
+        return
+    db.execute(_SUBTRACT_ACTIVITIES_SQL, {
+        "ids": list(worker_activity_ids),
+        "working_activity_id": WORKING_ACTIVITY_ID,
+        "now": datetime.now()
+    })
+
+
+def subtract_deleted_workers(db: Session, worker_ids: List[int]):
+    """То же для удаляемых работников: их активности удаляются каскадно, без commit"""
+    if not worker_ids:
+        return
+    activity_ids = [activity_id for (activity_id,) in db.query(models.WorkerActivity.id).filter(
+        and_(
+            models.WorkerActivity.worker_id.in_(list(worker_ids)),
+            models.WorkerActivity.activity_id == WORKING_ACTIVITY_ID,
+            models.WorkerActivity.end_time.isnot(None)
+        )
+    )]
+    subtract_deleted_activities(db, activity_ids)
+
 
 class MeanWorkingTimeCRUD:
     @staticmethod
     def create_or_update_mean_working_time(db: Session, uniform_id: int,
-                                         mean_seconds: int, worker_count: int, activity_count: int):
-        """Создает или обновляет запись о среднем времени работы"""
+                                         mean_seconds: int, worker_count: int, activity_count: int,
+                                         total_seconds: int = None):
+        """
+        Создает или обновляет запись о среднем времени работы.
+        total_seconds - точная сумма времени; если передана, mean_seconds вычисляется из нее
+        """
         existing = db.query(models.MeanWorkingTime).filter(
             models.MeanWorkingTime.uniform_id == uniform_id
         ).first()
         
+        if total_seconds is None:
+            # Без точной суммы - оценка по среднему; неизменившиеся итоги не трогаем, чтобы не копить округление
+            unchanged = existing and existing.mean_seconds == mean_seconds and existing.activity_count == activity_count
+            total_seconds = existing.total_seconds if unchanged else mean_seconds * activity_count
+        else:
+            mean_seconds = total_seconds // activity_count if activity_count else 0
+
         if existing:
             existing.mean_seconds = mean_seconds
+            existing.total_seconds = total_seconds
             existing.worker_count = worker_count
             existing.activity_count = activity_count
             existing.last_updated = datetime.now()
@@ -157,41 +838,63 @@ class MeanWorkingTimeCRUD:
             db_record = models.MeanWorkingTime(
                 uniform_id=uniform_id,
                 mean_seconds=mean_seconds,
+                total_seconds=total_seconds,
                 worker_count=worker_count,
                 activity_count=activity_count
             )
             db.add(db_record)
         
-        db.commit()
+        _commit(db)
         return existing or db_record
 
+    @staticmethod
+    def apply_closed_activities(db: Session, worker_activity_ids: List[int]):
+        """
+        Инкрементально учитывает закрытые активности "работает" в накопленных итогах.
+        Стоимость не зависит от объема истории
+        """
+        _apply_closed_working_activities(db, worker_activity_ids)
+        _commit(db)
+
     @staticmethod
     def calculate_and_update_all(db: Session):
-        """Вычисляет и обновляет среднее время работы для всех униформ"""
-        from sqlalchemy import func
-        
-        # Запрос для вычисления среднего времени работы (активность ID=1 - "работает")
-        results = db.query(
-            models.Uniform.id,
-            func.avg(func.extract('epoch', models.WorkerActivity.end_time - models.WorkerActivity.start_time)).label('mean_seconds'),
-            func.count(func.distinct(models.Worker.id)).label('worker_count'),
-            func.count(models.WorkerActivity.id).label('activity_count')
-        ).join(models.Worker, models.Worker.uniform_id == models.Uniform.id)\
-         .join(models.WorkerActivity, models.WorkerActivity.worker_id == models.Worker.id)\
-         .filter(models.WorkerActivity.activity_id == 1)\
-         .group_by(models.Uniform.id)\
-         .all()
-        
-        updated_records = []
-        for uniform_id, mean_seconds, worker_count, activity_count in results:
-            record = MeanWorkingTimeCRUD.create_or_update_mean_working_time(
-                db, uniform_id, 
-                int(mean_seconds) if mean_seconds else 0,
-                worker_count, activity_count
-            )
-            updated_records.append(record)
-        
-        return updated_records
+        """
+        Полный пересчет среднего времени работы для всех униформ по всей истории.
+        Итоги поддерживаются инкрементально (вместе с историей), пересчет нужен только для сверки.
+        Результат также записывается в историю mean_working_time_history
+        """
+        now = datetime.now()
+        params = {"working_activity_id": WORKING_ACTIVITY_ID, "now": now}
+        db.execute(_RECALCULATE_ALL_SQL, params)
+        db.execute(_RESET_MISSING_SQL, params)
+        _snapshot_history(db, now)
+        _commit(db)
+        return db.query(models.MeanWorkingTime).all()
+
+
+# Операции с историей среднего времени работы
+class MeanWorkingTimeHistoryCRUD:
+    @staticmethod
+    def record_snapshot(db: Session, moment: datetime = None):
+        """Записывает текущие значения среднего времени работы в историю"""
+        _snapshot_history(db, moment or datetime.now())
+        _commit(db)
+
+    @staticmethod
+    def get_history_range(db: Session, start_time: datetime, end_time: datetime,
+                          bucket: str = "minute", uniform_id: int = None,
+                          max_points: int = HISTORY_MAX_POINTS):
+        """
+        История среднего времени работы за период: список (point_time, mean_seconds, activity_count).
+        На длинных периодах точки прореживаются так, чтобы их было не больше max_points
+        """
+        return db.execute(HISTORY_RANGE_SQL, {
+            "step": history_step(start_time, end_time, bucket, max_points),
+            "bucket": bucket,
+            "start_time": start_time,
+            "end_time": end_time,
+            "uniform_id": uniform_id
+        }).all()
     
 # CRUD операции для Alert
 class AlertCRUD:
@@ -203,29 +906,80 @@ class AlertCRUD:
             danger_message=danger_message,
             alert_time=alert_time
         )
-        db.add(db_alert)
-        db.commit()
-        db.refresh(db_alert)
-        return db_alert
+        return _save(db, db_alert)
 
     @staticmethod
     def get_alert(db: Session, alert_id: int):
         return db.query(models.Alert).filter(models.Alert.id == alert_id).first()
 
+    @staticmethod
+    def bulk_create_alerts(db: Session, records: Iterable[dict],
+                           batch_size: int = BULK_BATCH_SIZE, return_ids: bool = False):
+        """
+        Массовое создание происшествий. Каждая запись - словарь с ключами
+        worker_id, alert_type, danger_message, alert_time
+        """
+        return _bulk_insert(db, models.Alert, records, batch_size, return_ids)
+
+    @staticmethod
+    def _alerts_by_worker_query(db: Session, worker_id: int):
+        return db.query(models.Alert).filter(models.Alert.worker_id == worker_id)
+
     @staticmethod
     def get_alerts_by_worker(db: Session, worker_id: int):
-        return db.query(models.Alert).filter(models.Alert.worker_id == worker_id).all()
+        return AlertCRUD._alerts_by_worker_query(db, worker_id).all()
+
+    @staticmethod
+    def get_alerts_by_worker_page(db: Session, worker_id: int, page_size: int = PAGE_SIZE, cursor: str = None):
+        """Страница происшествий работника по (alert_time, id); cursor - из предыдущего вызова"""
+        return _keyset_page(AlertCRUD._alerts_by_worker_query(db, worker_id),
+                            models.Alert.alert_time, models.Alert.id, page_size, cursor)
+
+    @staticmethod
+    def iter_alerts_by_worker(db: Session, worker_id: int, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Потоковый вариант get_alerts_by_worker: строки читаются серверным курсором пачками по chunk_size"""
+        return _stream(AlertCRUD._alerts_by_worker_query(db, worker_id), chunk_size)
+
+    @staticmethod
+    def _alerts_by_type_query(db: Session, alert_type: str):
+        return db.query(models.Alert).filter(models.Alert.alert_type == alert_type)
 
     @staticmethod
     def get_alerts_by_type(db: Session, alert_type: str):
-        return db.query(models.Alert).filter(models.Alert.alert_type == alert_type).all()
+        return AlertCRUD._alerts_by_type_query(db, alert_type).all()
 
     @staticmethod
-    def get_alerts_in_time_range(db: Session, start_time: datetime, end_time: datetime):
+    def get_alerts_by_type_page(db: Session, alert_type: str, page_size: int = PAGE_SIZE, cursor: str = None):
+        """Страница происшествий указанного типа по (alert_time, id); cursor - из предыдущего вызова"""
+        return _keyset_page(AlertCRUD._alerts_by_type_query(db, alert_type),
+                            models.Alert.alert_time, models.Alert.id, page_size, cursor)
+
+    @staticmethod
+    def iter_alerts_by_type(db: Session, alert_type: str, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Потоковый вариант get_alerts_by_type: строки читаются серверным курсором пачками по chunk_size"""
+        return _stream(AlertCRUD._alerts_by_type_query(db, alert_type), chunk_size)
+
+    @staticmethod
+    def _alerts_in_time_range_query(db: Session, start_time: datetime, end_time: datetime):
         return db.query(models.Alert).filter(
             and_(
                 models.Alert.alert_time >= start_time,
                 models.Alert.alert_time <= end_time
             )
-        ).order_by(models.Alert.alert_time).all()
+        ).order_by(models.Alert.alert_time)
+
+    @staticmethod
+    def get_alerts_in_time_range(db: Session, start_time: datetime, end_time: datetime):
+        return AlertCRUD._alerts_in_time_range_query(db, start_time, end_time).all()
+
+    @staticmethod
+    def get_alerts_in_time_range_page(db: Session, start_time: datetime, end_time: datetime, page_size: int = PAGE_SIZE, cursor: str = None):
+        """Страница происшествий за период по (alert_time, id); cursor - из предыдущего вызова"""
+        return _keyset_page(AlertCRUD._alerts_in_time_range_query(db, start_time, end_time),
+                            models.Alert.alert_time, models.Alert.id, page_size, cursor)
+
+    @staticmethod
+    def iter_alerts_in_time_range(db: Session, start_time: datetime, end_time: datetime, chunk_size: int = STREAM_CHUNK_SIZE):
+        """Потоковый вариант get_alerts_in_time_range: строки читаются серверным курсором пачками по chunk_size"""
+        return _stream(AlertCRUD._alerts_in_time_range_query(db, start_time, end_time), chunk_size)
 
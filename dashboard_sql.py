@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, DateTime
+from sqlalchemy.dialects.postgresql import psycopg2
+import crud
+import queries
+
+# Запросы дашборда test_bd.py (параметры в стиле psycopg2). Вынесены отдельно,
+# чтобы их можно было выполнять и замерять без запуска Streamlit
+
+# Водяной знак: дешевый запрос по индексам, меняется только при изменении данных
+WATERMARK_SQL = """
+    SELECT
+        (SELECT max(id) FROM workers),
+        (SELECT max(id) FROM worker_activities),
+        (SELECT max(last_updated) FROM mean_working_time),
+        (SELECT max(id) FROM alerts),
+        (SELECT count(*) FROM alerts
+         WHERE alert_type = 'человек на путях' AND alert_time >= NOW() - INTERVAL '1 minutes')
+"""
+
+# Последнее время появления считается в БД (max по индексам appearance_time и start_time)
+LATEST_TIME_SQL = """
+    SELECT GREATEST(
+        (SELECT max(appearance_time) FROM workers),
+        (SELECT max(start_time) FROM worker_activities)
+    ) AS latest_time
+"""
+
+# Занятость и униформа на последнее время: сгруппированные счетчики из queries.py,
+# скомпилированные в SQL с параметром %(latest_time)s
+_LATEST_TIME_PARAM = bindparam("latest_time", type_=DateTime)
+ACTIVITY_COUNTS_SQL = str(queries.activity_counts_query(_LATEST_TIME_PARAM).compile(dialect=psycopg2.dialect()))
+UNIFORM_COUNTS_SQL = str(queries.uniform_counts_query(_LATEST_TIME_PARAM).compile(dialect=psycopg2.dialect()))
+
+# История среднего времени активности из предагрегированной таблицы, прореженная
+# до одной точки на %(step)s секунд: тот же запрос, что MeanWorkingTimeHistoryCRUD.get_history_range
+MEAN_TIME_SQL = str(crud.HISTORY_RANGE_SQL.compile(dialect=psycopg2.dialect()))
+
+ALERTS_SQL = """
+    SELECT
+        alert_type,
+        danger_message,
+        alert_time
+    FROM alerts
+    WHERE alert_type = 'человек на путях' AND alert_time >= NOW() - INTERVAL '1 minutes'
+    ORDER BY alert_time DESC
+"""
+
+
+def history_params(hours: int, max_points: int, now: datetime = None):
+    """Параметры MEAN_TIME_SQL: не больше max_points точек интервала minute за последние hours часов"""
+    end_time = now or datetime.now()
+    start_time = end_time - timedelta(hours=hours)
+    return {
+        "start_time": start_time,
+        "end_time": end_time,
+        "step": crud.history_step(start_time, end_time, "minute", max_points),
+        "bucket": "minute",
+        "uniform_id": None,
+    }
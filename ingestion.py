@@ -0,0 +1,280 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+from sqlalchemy.exc import DBAPIError, OperationalError, InterfaceError, IntegrityError, DataError
+from database import get_session
+import crud
+
+# Максимальное количество событий в очереди; при заполнении производитель ждет
+QUEUE_MAX_SIZE = 10000
+# Сброс в БД при накоплении BATCH_SIZE событий или через FLUSH_INTERVAL секунд
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+# Сколько секунд производитель ждет места в полной очереди, прежде чем событие будет отброшено
+PUT_TIMEOUT = 0.5
+# Повторы пачки при временных ошибках БД (потеря соединения, перезапуск сервера)
+MAX_RETRIES = 3
+RETRY_DELAY = 0.5
+
+# Виды событий в порядке записи внутри пачки: работники раньше их активностей и происшествий
+WRITERS = {
+    "worker": crud.WorkerCRUD.bulk_create_workers,
+    "worker_activity": crud.WorkerActivityCRUD.bulk_create_worker_activities,
+    "alert": crud.AlertCRUD.bulk_create_alerts,
+}
+
+
+def _is_record_error(error: Exception) -> bool:
+    """Ошибка из-за данных отдельной записи (внешний ключ, недопустимое значение)"""
+    return isinstance(error, (IntegrityError, DataError))
+
+
+def _is_transient(error: Exception) -> bool:
+    """Ошибка, после которой имеет смысл повторить пачку"""
+    if isinstance(error, (OperationalError, InterfaceError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class IngestionQueue:
+    """
+    Очередь отложенной записи событий распознавания. Производители (обработчики камер)
+    кладут события без ожидания БД, отдельный поток-писатель сбрасывает их пачками
+    через bulk_create_* в одной транзакции на пачку.
+
+    put_* возвращает Future, который получает id созданной строки после записи пачки
+    (или исключение, если событие записать не удалось), либо None, если очередь переполнена
+    и событие отброшено. Future можно отменить, пока пачка с событием не начала записываться. Пачка с некорректной записью делится пополам до тех пор,
+    пока исключение не получат только ее события
+    """
+
+    def __init__(self, engine=None, max_size: int = QUEUE_MAX_SIZE, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL, put_timeout: float = PUT_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, retry_delay: float = RETRY_DELAY):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "accepted": 0,
+            "dropped": 0,
+            "written": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "batches": 0,
+            "retries": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Запускает поток-писатель"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="ingestion-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        """
+        Останавливает поток-писатель, предварительно записав все события из очереди.
+        События, добавленные во время остановки и не попавшие в запись, получают RuntimeError
+        (отмененные производителем пропускаются)
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return
+            self._thread = None
+        while True:
+            try:
+                _, _, future = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if not future.set_running_or_notify_cancel():
+                self._count("cancelled")
+                continue
+            self._count("failed")
+            future.set_exception(RuntimeError("Очередь записи остановлена"))
+
+    def put(self, kind: str, record: dict, timeout: float = None):
+        """
+        Добавляет событие вида kind (worker, worker_activity, alert).
+        При полной очереди ждет не дольше timeout (по умолчанию put_timeout) секунд
+        """
+        if kind not in WRITERS:
+            raise ValueError(f"Неизвестный вид события: {kind}")
+        if self._stop.is_set():
+            raise RuntimeError("Очередь записи остановлена")
+        future = Future()
+        try:
+            self._queue.put((kind, record, future), timeout=self.put_timeout if timeout is None else timeout)
+        except queue.Full:
+            self._count("dropped")
+            return None
+        self._count("accepted")
+        return future
+
+    def put_worker(self, train_id: int, uniform_id: int, helmet_on: bool,
+                   appearance_time, disappearance_time=None):
+        return self.put("worker", {
+            "train_id": train_id,
+            "uniform_id": uniform_id,
+            "helmet_on": helmet_on,
+            "appearance_time": appearance_time,
+            "disappearance_time": disappearance_time,
+        })
+
+    def put_worker_activity(self, worker_id: int, activity_id: int, start_time, end_time=None):
+        return self.put("worker_activity", {
+            "worker_id": worker_id,
+            "activity_id": activity_id,
+            "start_time": start_time,
+            "end_time": end_time,
+        })
+
+    def put_alert(self, worker_id: int, alert_type: str, danger_message: str, alert_time):
+        return self.put("alert", {
+            "worker_id": worker_id,
+            "alert_type": alert_type,
+            "danger_message": danger_message,
+            "alert_time": alert_time,
+        })
+
+    def _count(self, name: str, value: int = 1):
+        with self._metrics_lock:
+            self._metrics[name] += value
+
+    def metrics(self):
+        """Глубина очереди, размер пачек, время сброса и счетчики событий"""
+        with self._metrics_lock:
+            stats = dict(self._metrics)
+        total_flush_ms = stats.pop("total_flush_ms")
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_batch_size"] = stats["written"] / stats["batches"] if stats["batches"] else 0.0
+        stats["avg_flush_ms"] = total_flush_ms / stats["batches"] if stats["batches"] else 0.0
+        return stats
+
+    def _next_batch(self):
+        """Ждет первое событие, затем добирает пачку до batch_size или до истечения flush_interval"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # Поток-писатель не должен завершаться: события пачки получают исключение
+                print(f"Ошибка потока записи ({len(batch)} событий): {e}")
+                failed = [future for _, _, future in batch if not future.done()]
+                self._count("failed", len(failed))
+                for future in failed:
+                    future.set_exception(e)
+
+    def _write(self, batch):
+        """Записывает пачку одной транзакцией; возвращает id строк по видам событий"""
+        ids = {}
+        session = get_session(self.engine)
+        try:
+            with crud.unit_of_work(session):
+                for kind, writer in WRITERS.items():
+                    records = [record for record_kind, record, _ in batch if record_kind == kind]
+                    if records:
+                        ids[kind] = writer(session, records, return_ids=True)
+        finally:
+            session.close()
+        return ids
+
+    def _write_with_retries(self, batch):
+        """Записывает пачку, повторяя ее при временных ошибках БД"""
+        attempt = 0
+        while True:
+            try:
+                return self._write(batch)
+            except Exception as e:
+                if not (_is_transient(e) and attempt < self.max_retries):
+                    raise
+                attempt += 1
+                self._count("retries")
+                print(f"Ошибка записи пачки ({len(batch)} событий), повтор {attempt}/{self.max_retries}: {e}")
+                time.sleep(self.retry_delay * 2 ** (attempt - 1))
+
+    def _write_part(self, batch):
+        """
+        Записывает часть пачки. При ошибке данных делит ее пополам (порядок событий сохраняется),
+        чтобы исключение получили только некорректные события. Возвращает число записанных
+        """
+        try:
+            ids = self._write_with_retries(batch)
+        except Exception as e:
+            if _is_record_error(e) and len(batch) > 1:
+                middle = len(batch) // 2
+                return self._write_part(batch[:middle]) + self._write_part(batch[middle:])
+            print(f"Не удалось записать {'событие' if len(batch) == 1 else f'пачку ({len(batch)} событий)'}: {e}")
+            self._count("failed", len(batch))
+            for _, _, future in batch:
+                future.set_exception(e)
+            return 0
+
+        for kind in ids:
+            futures = [future for record_kind, _, future in batch if record_kind == kind]
+            for future, row_id in zip(futures, ids[kind]):
+                future.set_result(row_id)
+        return len(batch)
+
+    def _flush(self, batch):
+        # Отмененные производителем события не записываются; остальные отменить уже нельзя
+        pending = [item for item in batch if item[2].set_running_or_notify_cancel()]
+        if len(pending) < len(batch):
+            self._count("cancelled", len(batch) - len(pending))
+        if not pending:
+            return
+
+        started = time.perf_counter()
+        written = self._write_part(pending)
+        if not written:
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._metrics_lock:
+            self._metrics["written"] += written
+            self._metrics["batches"] += 1
+            self._metrics["last_batch_size"] = written
+            self._metrics["max_batch_size"] = max(self._metrics["max_batch_size"], written)
+            self._metrics["last_flush_ms"] = elapsed_ms
+            self._metrics["max_flush_ms"] = max(self._metrics["max_flush_ms"], elapsed_ms)
+            self._metrics["total_flush_ms"] += elapsed_ms
@@ -0,0 +1,212 @@
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+import json
+import re
+import sys
+import threading
+import time
+import weakref
+from sqlalchemy import event
+
+# Модули, методы которых считаются вызывающими запрос (первый такой кадр стека)
+CALLER_MODULES = ("crud", "queries", "retention", "partitioning")
+
+# Границы корзин гистограммы времени выполнения, мс; последняя корзина - все, что медленнее
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+# Запросы дольше SLOW_QUERY_MS попадают в журнал медленных запросов вместе с параметрами и планом
+SLOW_QUERY_MS = 200
+SLOW_LOG_SIZE = 100
+
+# Файл, в который сервис выгружает снимок статистики (его читает панель дашборда)
+QUERY_STATS_FILE = "query_stats.json"
+
+# Точка сохранения, внутри которой выполняется EXPLAIN медленного запроса
+EXPLAIN_SAVEPOINT = "instrumentation_explain"
+
+# Движки, к которым уже подключен сбор статистики
+_instrumented_engines = weakref.WeakSet()
+
+
+def _caller():
+    """Имя метода CRUD/запроса, из которого выполняется SQL, например TrainCRUD.get_train"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module in CALLER_MODULES and not frame.f_code.co_name.startswith("_"):
+            return f"{module}.{frame.f_code.co_qualname}"
+        frame = frame.f_back
+    return "другое"
+
+
+def _normalize(statement: str) -> str:
+    return re.sub(r"\s+", " ", statement).strip()
+
+
+class _StatementStats:
+    """Накопленная статистика одного запроса одного вызывающего метода"""
+
+    __slots__ = ("count", "total_ms", "max_ms", "rows", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+
+    def add(self, elapsed_ms: float, rows: int):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows
+        self.histogram[bisect_left(HISTOGRAM_BOUNDS_MS, elapsed_ms)] += 1
+
+
+class QueryStats:
+    """
+    Статистика SQL-запросов процесса: время, количество строк и гистограмма
+    по каждой паре (вызывающий метод, текст запроса), плюс журнал медленных запросов
+    """
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS, slow_log_size: int = SLOW_LOG_SIZE, explain: bool = True):
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._slow = deque(maxlen=slow_log_size)
+        self.started_at = datetime.now()
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+            self.started_at = datetime.now()
+
+    def record(self, caller: str, statement: str, elapsed_ms: float, rows: int):
+        key = (caller, _normalize(statement))
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _StatementStats()
+            stats.add(elapsed_ms, rows)
+
+    def record_slow(self, caller: str, statement: str, parameters, elapsed_ms: float, plan: str = None):
+        entry = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "caller": caller,
+            "elapsed_ms": round(elapsed_ms, 3),
+            "statement": _normalize(statement),
+            "parameters": repr(parameters),
+            "plan": plan,
+        }
+        with self._lock:
+            self._slow.append(entry)
+        print(f"Медленный запрос ({elapsed_ms:.0f} мс) из {caller}: {entry['statement'][:200]}")
+
+    def snapshot(self):
+        """Снимок статистики: запросы по убыванию суммарного времени и журнал медленных запросов"""
+        with self._lock:
+            items = [(key, stats.count, stats.total_ms, stats.max_ms, stats.rows, list(stats.histogram))
+                     for key, stats in self._stats.items()]
+            slow = list(self._slow)
+        statements = [
+            {
+                "caller": caller,
+                "statement": statement,
+                "count": count,
+                "total_ms": round(total_ms, 3),
+                "avg_ms": round(total_ms / count, 3),
+                "max_ms": round(max_ms, 3),
+                "rows": rows,
+                "histogram": dict(zip([f"<={bound}" for bound in HISTOGRAM_BOUNDS_MS] + ["inf"], histogram)),
+            }
+            for (caller, statement), count, total_ms, max_ms, rows, histogram in items
+        ]
+        statements.sort(key=lambda item: item["total_ms"], reverse=True)
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "exported_at": datetime.now().isoformat(timespec="seconds"),
+            "slow_query_ms": self.slow_ms,
+            "statements": statements,
+            "slow_queries": slow,
+        }
+
+    def by_caller(self):
+        """Суммарное время и количество запросов по вызывающим методам, по убыванию времени"""
+        totals = {}
+        for item in self.snapshot()["statements"]:
+            total = totals.setdefault(item["caller"], {"caller": item["caller"], "count": 0, "total_ms": 0.0, "rows": 0})
+            total["count"] += item["count"]
+            total["total_ms"] += item["total_ms"]
+            total["rows"] += item["rows"]
+        return sorted(totals.values(), key=lambda item: item["total_ms"], reverse=True)
+
+    def export_snapshot(self, path: str = QUERY_STATS_FILE):
+        """Записывает снимок статистики в JSON-файл"""
+        with open(path, "w", encoding="utf-8") as output:
+            json.dump(self.snapshot(), output, ensure_ascii=False, indent=2)
+        return path
+
+
+# Статистика процесса, общая для всех инструментированных движков
+query_stats = QueryStats()
+
+
+def _explain(cursor, statement, parameters):
+    """
+    План запроса на том же соединении (сырой курсор DBAPI, события движка не вызываются).
+    EXPLAIN выполняется в точке сохранения: при ошибке откат до нее, и транзакция пользователя
+    остается рабочей. Никогда не выбрасывает исключение: диагностика не должна ломать запрос пользователя
+    """
+    explain_cursor = None
+    try:
+        explain_cursor = cursor.connection.cursor()
+        explain_cursor.execute(f"SAVEPOINT {EXPLAIN_SAVEPOINT}")
+        try:
+            explain_cursor.execute("EXPLAIN " + statement, parameters)
+            rows = explain_cursor.fetchall()
+        except Exception:
+            explain_cursor.execute(f"ROLLBACK TO SAVEPOINT {EXPLAIN_SAVEPOINT}")
+            raise
+        finally:
+            explain_cursor.execute(f"RELEASE SAVEPOINT {EXPLAIN_SAVEPOINT}")
+        return "\n".join(" | ".join(str(value) for value in row) for row in rows)
+    except Exception as e:
+        print(f"EXPLAIN медленного запроса не выполнен: {e}")
+        return f"EXPLAIN не выполнен: {e}"
+    finally:
+        if explain_cursor is not None:
+            try:
+                explain_cursor.close()
+            except Exception:
+                pass
+
+
+def instrument(engine, stats: QueryStats = None):
+    """
+    Подключает сбор статистики к движку через события before/after_cursor_execute.
+    Для асинхронного движка передается engine.sync_engine
+    """
+    stats = stats or query_stats
+    if engine in _instrumented_engines:
+        return engine
+    _instrumented_engines.add(engine)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.instrumentation_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - context.instrumentation_start) * 1000
+        caller = _caller()
+        stats.record(caller, statement, elapsed_ms, max(cursor.rowcount, 0))
+        if elapsed_ms >= stats.slow_ms:
+            plan = None
+            if stats.explain and not executemany and statement.lstrip().upper().startswith("SELECT"):
+                plan = _explain(cursor, statement, parameters)
+            stats.record_slow(caller, statement, parameters, elapsed_ms, plan)
+
+    return engine
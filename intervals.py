@@ -0,0 +1,176 @@
+from bisect import bisect_right
+from datetime import datetime
+from math import isqrt
+from sqlalchemy.orm import Session
+import queries
+
+# Открытый интервал (disappearance_time / end_time = NULL) считается длящимся до сих пор
+OPEN_END = datetime.max
+
+# Минимальный размер буфера новых интервалов до перестроения индекса
+MIN_PENDING = 64
+
+
+class _Node:
+    """Узел центрированного дерева интервалов"""
+
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, center, entries, left, right):
+        self.center = center
+        self.by_start = sorted(entries, key=lambda entry: entry[0])
+        self.by_end = sorted(entries, key=lambda entry: entry[1], reverse=True)
+        self.left = left
+        self.right = right
+
+
+def _build(entries):
+    if not entries:
+        return None
+    endpoints = sorted([entry[0] for entry in entries] + [entry[1] for entry in entries])
+    center = endpoints[len(endpoints) // 2]
+    left = [entry for entry in entries if entry[1] < center]
+    right = [entry for entry in entries if entry[0] > center]
+    here = [entry for entry in entries if entry[0] <= center <= entry[1]]
+    return _Node(center, here, _build(left), _build(right))
+
+
+class IntervalIndex:
+    """
+    Индекс интервалов времени в памяти: кто присутствовал в момент T и какие интервалы
+    пересекаются с периодом. Запросы выполняются за O(log n + k).
+    Интервалы с end = None считаются открытыми (длятся до сих пор).
+
+    Индекс можно поддерживать в актуальном состоянии: новые интервалы попадают в небольшой
+    буфер и переносятся в дерево при его переполнении
+    """
+
+    def __init__(self, intervals=()):
+        self._entries = {}
+        self._next_key = 0
+        self._root = None
+        self._starts = []
+        self._pending = []
+        self._removed = set()
+        for start, end, payload in intervals:
+            self._insert(start, end, payload)
+        self._rebuild()
+
+    @classmethod
+    def from_rows(cls, rows, start_index: int = 0, end_index: int = 1):
+        """Индекс по строкам результата запроса; полезная нагрузка - сама строка"""
+        return cls((row[start_index], row[end_index], row) for row in rows)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _insert(self, start, end, payload, key=None):
+        if key is None:
+            key = self._next_key
+            self._next_key += 1
+        entry = (start, OPEN_END if end is None else end, key, payload)
+        self._entries[key] = entry
+        return key, entry
+
+    def _rebuild(self):
+        entries = list(self._entries.values())
+        self._root = _build(entries)
+        self._starts = sorted((entry[0], entry[2]) for entry in entries)
+        self._pending = []
+        self._removed = set()
+
+    def _pending_limit(self):
+        return max(MIN_PENDING, isqrt(len(self._entries)))
+
+    def _maybe_rebuild(self):
+        if len(self._pending) + len(self._removed) > self._pending_limit():
+            self._rebuild()
+
+    def add(self, start: datetime, end: datetime = None, payload=None) -> int:
+        """Добавляет интервал, возвращает ключ для последующего close/remove"""
+        key, entry = self._insert(start, end, payload)
+        self._pending.append(entry)
+        self._maybe_rebuild()
+        return key
+
+    def remove(self, key: int):
+        """Удаляет интервал по ключу"""
+        self._entries.pop(key)
+        pending_count = len(self._pending)
+        self._pending = [entry for entry in self._pending if entry[2] != key]
+        if len(self._pending) == pending_count:
+            self._removed.add(key)
+        self._maybe_rebuild()
+
+    def close(self, key: int, end: datetime):
+        """Закрывает открытый интервал (работник ушел из кадра / активность завершилась)"""
+        start, _, _, payload = self._entries[key]
+        self.remove(key)
+        _, entry = self._insert(start, end, payload, key)
+        self._pending.append(entry)
+        self._maybe_rebuild()
+
+    def _live(self, entry):
+        # Старая версия интервала после close/remove остается в дереве до перестроения
+        return entry[2] not in self._removed and self._entries.get(entry[2]) is entry
+
+    def _stab(self, moment):
+        node = self._root
+        while node is not None:
+            if moment < node.center:
+                for entry in node.by_start:
+                    if entry[0] > moment:
+                        break
+                    yield entry
+                node = node.left
+            elif moment > node.center:
+                for entry in node.by_end:
+                    if entry[1] < moment:
+                        break
+                    yield entry
+                node = node.right
+            else:
+                yield from node.by_start
+                return
+
+    def at(self, moment: datetime):
+        """Полезная нагрузка интервалов, содержащих момент moment"""
+        result = [entry[3] for entry in self._stab(moment) if self._live(entry)]
+        result.extend(entry[3] for entry in self._pending if entry[0] <= moment <= entry[1])
+        return result
+
+    def count_at(self, moment: datetime) -> int:
+        """Количество интервалов, содержащих момент moment"""
+        return len(self.at(moment))
+
+    def overlapping(self, start: datetime, end: datetime):
+        """Полезная нагрузка интервалов, пересекающихся с [start, end]"""
+        # Содержащие start плюс начавшиеся внутри (start, end] - множества не пересекаются
+        result = [entry[3] for entry in self._stab(start) if self._live(entry)]
+        low = bisect_right(self._starts, (start, float("inf")))
+        high = bisect_right(self._starts, (end, float("inf")))
+        for _, key in self._starts[low:high]:
+            if key not in self._removed and key in self._entries:
+                entry = self._entries[key]
+                if start < entry[0] <= end:
+                    result.append(entry[3])
+        result.extend(entry[3] for entry in self._pending if entry[0] <= end and entry[1] >= start)
+        return result
+
+
+def presence_index(db: Session, train_id: int, hours: int = 24) -> IntervalIndex:
+    """
+    Индекс присутствия работников вокруг поезда по результату get_workers_presence_timeline,
+    включая тех, кто еще в кадре. Полезная нагрузка - строка (appearance_time, disappearance_time, color, helmet_on)
+    """
+    return IntervalIndex.from_rows(
+        queries.AnalysisQueries.get_workers_presence_timeline(db, train_id, hours, include_open=True)
+    )
+
+
+def activity_index(db: Session, worker_id: int) -> IntervalIndex:
+    """
+    Индекс активностей работника по результату get_worker_activity_timeline.
+    Полезная нагрузка - строка (start_time, end_time, name, description)
+    """
+    return IntervalIndex.from_rows(queries.AnalysisQueries.get_worker_activity_timeline(db, worker_id))
@@ -0,0 +1,41 @@
+from collections import OrderedDict
+import threading
+
+
+class LRUCache:
+    """
+    Ограниченный потокобезопасный LRU-кэш в памяти процесса: при переполнении
+    вытесняется значение, к которому дольше всего не обращались.
+    None не кэшируется: get возвращает None при промахе
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Удаляет значение key, без key - очищает кэш"""
+        with self._lock:
+            if key is None:
+                self._items.clear()
+            else:
+                self._items.pop(key, None)
@@ -0,0 +1,149 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy import text, table, column
+from datetime import datetime, timedelta
+import models
+
+
+class MaterializedView:
+    """
+    Материализованное представление с уникальным индексом (нужен для REFRESH CONCURRENTLY)
+    и списком таблиц, от которых оно зависит
+    """
+
+    def __init__(self, name: str, query: str, unique_columns, tables, indexes=()):
+        self.name = name
+        self.query = query
+        self.unique_columns = unique_columns
+        self.tables = tables
+        self.indexes = indexes
+
+    def __repr__(self):
+        return f"<MaterializedView(name='{self.name}')>"
+
+
+# Общее время по цвету униформы и виду деятельности (AnalysisQueries.calculate_activity_time_by_uniform)
+ACTIVITY_TIME_BY_UNIFORM = MaterializedView(
+    "mv_activity_time_by_uniform",
+    """
+    SELECT
+        a.name AS activity_name,
+        u.color,
+        sum(extract(epoch FROM wa.end_time - wa.start_time)) AS total_seconds
+    FROM uniforms u
+    JOIN workers w ON w.uniform_id = u.id
+    JOIN worker_activities wa ON wa.worker_id = w.id
+    JOIN activities a ON a.id = wa.activity_id
+    GROUP BY a.name, u.color
+    """,
+    unique_columns=("activity_name", "color"),
+    tables=("uniforms", "workers", "worker_activities", "activities"),
+)
+
+# Количество работников по поездам (AnalysisQueries.get_busiest_trains)
+BUSIEST_TRAINS = MaterializedView(
+    "mv_busiest_trains",
+    """
+    SELECT
+        t.id AS train_id,
+        t.train_number,
+        count(w.id) AS workers_count
+    FROM trains t
+    JOIN workers w ON w.train_id = t.id
+    GROUP BY t.id, t.train_number
+    """,
+    unique_columns=("train_id",),
+    tables=("trains", "workers"),
+    indexes=(("workers_count", "train_id"),),
+)
+
+MATERIALIZED_VIEWS = {view.name: view for view in (ACTIVITY_TIME_BY_UNIFORM, BUSIEST_TRAINS)}
+
+# Описания представлений для построения запросов
+activity_time_by_uniform_view = table(
+    ACTIVITY_TIME_BY_UNIFORM.name, column("activity_name"), column("color"), column("total_seconds")
+)
+busiest_trains_view = table(
+    BUSIEST_TRAINS.name, column("train_id"), column("train_number"), column("workers_count")
+)
+
+
+def mark_refreshed(connection, name: str, moment: datetime):
+    """
+    Записывает время обновления представления или предагрегированной таблицы
+    (connection - сессия или соединение). Без commit
+    """
+    refresh = models.MaterializedViewRefresh
+    statement = pg_insert(refresh).values(name=name, refreshed_at=moment)
+    connection.execute(statement.on_conflict_do_update(
+        index_elements=[refresh.name], set_={"refreshed_at": statement.excluded.refreshed_at}
+    ))
+
+
+def create_materialized_views(db: Session):
+    """Создает отсутствующие представления вместе с их индексами. Без commit"""
+    now = datetime.now()
+    for view in MATERIALIZED_VIEWS.values():
+        if db.execute(text("SELECT to_regclass(:name)"), {"name": view.name}).scalar() is not None:
+            continue
+        db.execute(text(f"CREATE MATERIALIZED VIEW {view.name} AS {view.query}"))
+        db.execute(text(f"CREATE UNIQUE INDEX ux_{view.name} ON {view.name} ({', '.join(view.unique_columns)})"))
+        for columns in view.indexes:
+            db.execute(text(f"CREATE INDEX ix_{view.name}_{'_'.join(columns)} ON {view.name} ({', '.join(columns)})"))
+        mark_refreshed(db, view.name, now)
+
+
+def drop_materialized_views(db: Session, table_name: str = None):
+    """Удаляет представления, зависящие от table_name (по умолчанию - все). Без commit"""
+    dropped = []
+    for view in MATERIALIZED_VIEWS.values():
+        if table_name is None or table_name in view.tables:
+            db.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {view.name}"))
+            dropped.append(view.name)
+    return dropped
+
+
+def refresh_materialized_view(db: Session, name: str, concurrently: bool = True) -> bool:
+    """
+    Обновляет представление. CONCURRENTLY не блокирует чтение на время обновления.
+    Обновление выполняется на отдельном соединении в собственной транзакции и не затрагивает
+    транзакцию сессии db (в том числе crud.unit_of_work).
+    Если представление уже обновляет другой процесс, возвращает False, не дожидаясь его
+    """
+    view = MATERIALIZED_VIEWS[name]
+    with db.get_bind().engine.connect() as connection:
+        with connection.begin():
+            locked = connection.execute(
+                text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"), {"name": view.name}
+            ).scalar()
+            if not locked:
+                return False
+            started = datetime.now()
+            connection.execute(text(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if concurrently else ''}{view.name}"))
+            mark_refreshed(connection, view.name, started)
+    return True
+
+
+def refresh_materialized_views(db: Session, concurrently: bool = True):
+    """Обновляет все представления, возвращает имена обновленных"""
+    return [name for name in MATERIALIZED_VIEWS if refresh_materialized_view(db, name, concurrently)]
+
+
+def get_staleness(db: Session, name: str):
+    """Сколько прошло с последнего обновления представления (None - неизвестно)"""
+    refreshed_at = db.query(models.MaterializedViewRefresh.refreshed_at).filter(
+        models.MaterializedViewRefresh.name == name
+    ).scalar()
+    return None if refreshed_at is None else datetime.now() - refreshed_at
+
+
+def ensure_fresh(db: Session, name: str, max_staleness: timedelta) -> bool:
+    """
+    Обновляет представление, если его данные старше max_staleness.
+    Возвращает False, если представление устарело, а обновить его сейчас нельзя (его обновляет
+    другой процесс): тогда читать нужно из таблиц, иначе данные окажутся старше max_staleness
+    """
+    staleness = get_staleness(db, name)
+    if staleness is not None and staleness <= max_staleness:
+        return True
+    return refresh_materialized_view(db, name)
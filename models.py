@@ -1,11 +1,48 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, BigInteger
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, BigInteger, UniqueConstraint, Index, CheckConstraint, func, literal_column, false, and_, or_
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
 
+
+def time_range(start, end):
+    """
+    Интервал [start, end] как tsrange. Используется и в GiST-индексах, и в запросах,
+    чтобы выражение в запросе совпадало с индексированным. NULL в end - открытый интервал
+    """
+    return func.tsrange(start, end, literal_column("'[]'"))
+
+
+def overlaps(start, end, range_start, range_end):
+    """
+    Условие пересечения интервала [start, end] с [range_start, range_end] (обслуживается GiST-индексом).
+    Перевернутое окно (range_start > range_end) ни с чем не пересекается: tsrange для него вызвал бы ошибку.
+    Дополнительно задаются простые условия на границы: по выражению tsrange PostgreSQL
+    не может отсечь секции, секционированные по start (partitioning.py)
+    """
+    if isinstance(range_start, datetime) and isinstance(range_end, datetime) and range_start > range_end:
+        return false()
+    conditions = [time_range(start, end).op("&&")(time_range(range_start, range_end))]
+    if range_end is not None:
+        conditions.append(start <= range_end)
+    if range_start is not None:
+        conditions.append(or_(end.is_(None), end >= range_start))
+    return and_(*conditions)
+
+
+def valid_range(start: str, end: str, name: str):
+    """
+    CHECK: конец интервала не раньше начала. Без него такая строка падает
+    на вычислении tsrange для GiST-индекса с непонятной ошибкой
+    """
+    return CheckConstraint(f"{end} IS NULL OR {end} >= {start}", name=name)
+
+
 class Train(Base):
     """Модель поездов"""
     __tablename__ = "trains"
+    __table_args__ = (
+        valid_range("arrival_time", "departure_time", "ck_trains_departure_after_arrival"),
+    )
 
     id = Column(BigInteger, primary_key=True, index=True)
     train_number = Column(String(20), nullable=False, index=True)
@@ -13,7 +50,7 @@ class Train(Base):
     departure_time = Column(DateTime, nullable=True)  # Изменено на nullable=True
     
     # Связи
-    workers = relationship("Worker", back_populates="train", cascade="all, delete-orphan")
+    workers = relationship("Worker", back_populates="train", cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f"<Train(id={self.id}, number='{self.train_number}')>"
@@ -51,6 +88,9 @@ class Activity(Base):
 class Worker(Base):
     """Модель работников"""
     __tablename__ = "workers"
+    __table_args__ = (
+        valid_range("appearance_time", "disappearance_time", "ck_workers_disappearance_after_appearance"),
+    )
 
     id = Column(BigInteger, primary_key=True, index=True)
     train_id = Column(BigInteger, ForeignKey("trains.id", ondelete="CASCADE"), nullable=False)
@@ -62,7 +102,7 @@ class Worker(Base):
     # Связи
     train = relationship("Train", back_populates="workers")
     uniform = relationship("Uniform", back_populates="workers")
-    activities = relationship("WorkerActivity", back_populates="worker", cascade="all, delete-orphan")
+    activities = relationship("WorkerActivity", back_populates="worker", cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f"<Worker(id={self.id}, train_id={self.train_id}, uniform_id={self.uniform_id})>"
@@ -71,6 +111,9 @@ class Worker(Base):
 class WorkerActivity(Base):
     """Модель активностей работников"""
     __tablename__ = "worker_activities"
+    __table_args__ = (
+        valid_range("start_time", "end_time", "ck_worker_activities_end_after_start"),
+    )
 
     id = Column(BigInteger, primary_key=True, index=True)
     worker_id = Column(BigInteger, ForeignKey("workers.id", ondelete="CASCADE"), nullable=False)
@@ -94,6 +137,7 @@ class MeanWorkingTime(Base):
     uniform_id = Column(Integer, ForeignKey("uniforms.id"), nullable=False, unique=True)
     # uniform_color УДАЛЕН - используем связь с таблицей uniforms
     mean_seconds = Column(Integer, nullable=False)  # Среднее время в секундах
+    total_seconds = Column(BigInteger, nullable=False, default=0, server_default="0")  # Суммарное время в секундах
     worker_count = Column(Integer, nullable=False)  # Количество работников
     activity_count = Column(Integer, nullable=False)  # Количество активностей
     last_updated = Column(DateTime, default=datetime.now, nullable=False)
@@ -103,7 +147,62 @@ class MeanWorkingTime(Base):
 
     def __repr__(self):
         return f"<MeanWorkingTime(uniform_id={self.uniform_id}, mean_seconds={self.mean_seconds})>"
-    
+
+
+class MeanWorkingTimeHistory(Base):
+    """Модель истории среднего времени работы по униформам (один снимок на интервал)"""
+    __tablename__ = "mean_working_time_history"
+    __table_args__ = (
+        UniqueConstraint("uniform_id", "bucket", "bucket_start", name="uq_mean_history_uniform_bucket"),
+        Index("ix_mean_history_bucket_start", "bucket", "bucket_start"),
+    )
+
+    id = Column(BigInteger, primary_key=True, index=True)
+    uniform_id = Column(Integer, ForeignKey("uniforms.id"), nullable=False)
+    bucket = Column(String(10), nullable=False)  # размер интервала: minute, hour, shift
+    bucket_start = Column(DateTime, nullable=False)  # начало интервала
+    mean_seconds = Column(Integer, nullable=False)
+    worker_count = Column(Integer, nullable=False)
+    activity_count = Column(Integer, nullable=False)
+
+    # Связи
+    uniform = relationship("Uniform")
+
+    def __repr__(self):
+        return f"<MeanWorkingTimeHistory(uniform_id={self.uniform_id}, bucket='{self.bucket}', bucket_start={self.bucket_start})>"
+
+
+class HelmetComplianceRollup(Base):
+    """Модель предагрегированной статистики использования касок по поездам, униформам и интервалам"""
+    __tablename__ = "helmet_compliance_rollup"
+    __table_args__ = (
+        UniqueConstraint("train_id", "uniform_id", "bucket", "bucket_start", name="uq_helmet_rollup_group"),
+        Index("ix_helmet_rollup_bucket_start", "bucket", "bucket_start"),
+    )
+
+    id = Column(BigInteger, primary_key=True, index=True)
+    train_id = Column(BigInteger, ForeignKey("trains.id", ondelete="CASCADE"), nullable=False)
+    uniform_id = Column(Integer, ForeignKey("uniforms.id"), nullable=False)
+    bucket = Column(String(10), nullable=False)  # размер интервала: minute, hour, shift
+    bucket_start = Column(DateTime, nullable=False)  # начало интервала
+    total_workers = Column(Integer, nullable=False)  # всего работников
+    helmet_workers = Column(Integer, nullable=False)  # работников в каске
+
+    def __repr__(self):
+        return f"<HelmetComplianceRollup(train_id={self.train_id}, uniform_id={self.uniform_id}, bucket_start={self.bucket_start})>"
+
+
+class MaterializedViewRefresh(Base):
+    """Время последнего обновления материализованного представления или предагрегированной таблицы"""
+    __tablename__ = "materialized_view_refresh"
+
+    name = Column(String(63), primary_key=True)  # имя представления
+    refreshed_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<MaterializedViewRefresh(name='{self.name}', refreshed_at={self.refreshed_at})>"
+
+
 class Alert(Base):
     """Модель происшествий и предупреждений"""
     __tablename__ = "alerts"
@@ -112,10 +211,32 @@ class Alert(Base):
     worker_id = Column(BigInteger, ForeignKey("workers.id", ondelete="CASCADE"), nullable=False)
     alert_type = Column(String(100), nullable=False, index=True)  # тип происшествия
     danger_message = Column(Text, nullable=False)  # сообщение об опасности
-    alert_time = Column(DateTime, nullable=False, index=True)  # время происшествия
+    alert_time = Column(DateTime, nullable=False)  # время происшествия
     
     # Связи
     worker = relationship("Worker")
 
     def __repr__(self):
-        return f"<Alert(id={self.id}, worker_id={self.worker_id}, type='{self.alert_type}')>"
\ No newline at end of file
+        return f"<Alert(id={self.id}, worker_id={self.worker_id}, type='{self.alert_type}')>"
+
+
+# Индексы для запросов по пересечению интервалов (start <= :end AND end >= :start)
+# и для внешних ключей. Составные B-tree индексы также обслуживают max() и сортировку по началу интервала
+Index("ix_trains_arrival_departure", Train.arrival_time, Train.departure_time)
+Index("ix_trains_presence_range", time_range(Train.arrival_time, Train.departure_time), postgresql_using="gist")
+
+Index("ix_workers_appearance_disappearance", Worker.appearance_time, Worker.disappearance_time)
+Index("ix_workers_presence_range", time_range(Worker.appearance_time, Worker.disappearance_time), postgresql_using="gist")
+Index("ix_workers_train_id", Worker.train_id)
+Index("ix_workers_uniform_id", Worker.uniform_id)
+
+Index("ix_worker_activities_start_end", WorkerActivity.start_time, WorkerActivity.end_time)
+Index("ix_worker_activities_range", time_range(WorkerActivity.start_time, WorkerActivity.end_time), postgresql_using="gist")
+Index("ix_worker_activities_worker_id", WorkerActivity.worker_id)
+Index("ix_worker_activities_activity_id", WorkerActivity.activity_id)
+
+
+# Индексы для постраничного просмотра по ключу (время, id)
+Index("ix_alerts_time_id", Alert.alert_time, Alert.id)
+Index("ix_alerts_type_time_id", Alert.alert_type, Alert.alert_time, Alert.id)
+Index("ix_alerts_worker_time_id", Alert.worker_id, Alert.alert_time, Alert.id)
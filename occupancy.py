@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+import queries
+
+
+class OccupancyCurves:
+    """
+    Ступенчатые кривые занятости: сколько работников находится вокруг поезда в каждый момент,
+    отдельно для каждой группы (train_id, цвет униформы, каска).
+    Интервал присутствия считается полуоткрытым [appearance_time, disappearance_time)
+    """
+
+    def __init__(self, keys, groups, times, counts, window_start, window_end):
+        self.keys = keys  # список (train_id, color, helmet_on) по номеру группы
+        self.groups = groups  # номер группы каждой ступени
+        self.times = times  # время ступени, datetime64[s]
+        self.counts = counts  # количество работников начиная с этого времени
+        self.window_start = window_start
+        self.window_end = window_end
+
+    def resample(self, step: timedelta, start: datetime = None, end: datetime = None) -> pd.DataFrame:
+        """
+        Значения кривых на равномерной сетке с шагом step.
+        Строки - моменты времени, столбцы - MultiIndex (train_id, uniform_color, helmet_on)
+        """
+        start = np.datetime64(start or self.window_start, "s")
+        end = np.datetime64(end or self.window_end, "s")
+        grid = np.arange(start, end, np.timedelta64(int(step.total_seconds()), "s"))
+        columns = pd.MultiIndex.from_tuples(self.keys, names=["train_id", "uniform_color", "helmet_on"])
+        if not len(self.times) or not len(grid):
+            values = np.zeros((len(grid), len(self.keys)), dtype=np.int64)
+            return pd.DataFrame(values, index=pd.DatetimeIndex(grid, name="time"), columns=columns)
+
+        # Ступени отсортированы по (группа, время): ключ group * span + смещение времени
+        # позволяет найти последнюю ступень не позже момента для всех групп одним searchsorted
+        origin = min(self.times.min(), grid[0])
+        span = int((max(self.times.max(), grid[-1]) - origin).astype(np.int64)) + 1
+        step_keys = self.groups.astype(np.int64) * span + (self.times - origin).astype(np.int64)
+        group_ids = np.arange(len(self.keys), dtype=np.int64)[:, None]
+        query_keys = group_ids * span + (grid - origin).astype(np.int64)[None, :]
+
+        positions = np.searchsorted(step_keys, query_keys, side="right") - 1
+        found = (positions >= 0) & (self.groups[np.clip(positions, 0, None)] == group_ids)
+        values = np.where(found, self.counts[np.clip(positions, 0, None)], 0)
+        return pd.DataFrame(values.T, index=pd.DatetimeIndex(grid, name="time"), columns=columns)
+
+    def per_train(self, step: timedelta) -> pd.DataFrame:
+        """Общее количество работников вокруг каждого поезда на сетке с шагом step"""
+        frame = self.resample(step)
+        return frame.T.groupby(level="train_id").sum().T
+
+
+def occupancy_curves(rows, window_start: datetime, window_end: datetime) -> OccupancyCurves:
+    """
+    Строит кривые занятости одним векторизованным проходом заметающей прямой.
+    rows - строки (train_id, appearance_time, disappearance_time, color, helmet_on);
+    открытые интервалы (disappearance_time = NULL) продолжаются до window_end
+    """
+    frame = pd.DataFrame(rows, columns=["train_id", "appearance_time", "disappearance_time", "color", "helmet_on"])
+    start = np.datetime64(window_start, "s")
+    end = np.datetime64(window_end, "s")
+    if frame.empty:
+        empty = np.array([], dtype=np.int64)
+        return OccupancyCurves([], empty, np.array([], dtype="datetime64[s]"), empty, window_start, window_end)
+
+    group_codes, keys = pd.MultiIndex.from_frame(frame[["train_id", "color", "helmet_on"]]).factorize()
+    appearance = frame["appearance_time"].to_numpy(dtype="datetime64[s]")
+    disappearance = frame["disappearance_time"].to_numpy(dtype="datetime64[s]")
+    disappearance = np.where(np.isnat(disappearance), end, disappearance)
+
+    # Обрезаем интервалы по окну и отбрасываем пустые
+    appearance = np.maximum(appearance, start)
+    disappearance = np.minimum(disappearance, end)
+    valid = appearance < disappearance
+    group_codes = group_codes[valid]
+
+    # События: +1 при появлении, -1 при уходе. Сортировка по (группа, время, знак):
+    # при совпадении времени уход обрабатывается раньше появления
+    groups = np.concatenate([group_codes, group_codes])
+    times = np.concatenate([appearance[valid], disappearance[valid]])
+    deltas = np.concatenate([np.ones(valid.sum(), dtype=np.int64), -np.ones(valid.sum(), dtype=np.int64)])
+    order = np.lexsort((deltas, times, groups))
+    groups, times, deltas = groups[order], times[order], deltas[order]
+
+    # Сумма событий каждой группы равна нулю, поэтому общая накопленная сумма
+    # сама обнуляется на границах групп
+    counts = np.cumsum(deltas)
+
+    # Из событий с одинаковыми (группа, время) оставляем последнее - итоговое значение ступени
+    last = np.ones(len(times), dtype=bool)
+    last[:-1] = (groups[:-1] != groups[1:]) | (times[:-1] != times[1:])
+    return OccupancyCurves(list(keys), groups[last], times[last], counts[last], window_start, window_end)
+
+
+def depot_occupancy(db: Session, hours: int = 24) -> OccupancyCurves:
+    """Кривые занятости для всех поездов депо за последние hours часов"""
+    window_end = datetime.now()
+    window_start = window_end - timedelta(hours=hours)
+    rows = queries.AnalysisQueries.get_depot_presence_timeline(db, hours, include_open=True)
+    return occupancy_curves(rows, window_start, window_end)
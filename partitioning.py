@@ -0,0 +1,186 @@
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex, AddConstraint
+from datetime import datetime, timedelta
+import re
+from database import Base
+import models  # регистрирует модели в Base.metadata
+import materialized
+
+# Таблицы, которые можно секционировать по времени, и ключ секционирования.
+# workers не секционируется: на workers.id ссылаются внешние ключи worker_activities и alerts,
+# а первичный ключ секционированной таблицы обязан включать ключ секционирования
+PARTITIONED_TABLES = {
+    "worker_activities": "start_time",
+    "alerts": "alert_time",
+}
+
+PARTITION_INTERVALS = {
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+}
+
+# На сколько интервалов вперед заранее создавать секции
+PARTITIONS_AHEAD = 7
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def _interval_start(moment: datetime, interval: str) -> datetime:
+    """Начало дня или недели (с понедельника), в который попадает moment"""
+    start = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if interval == "week":
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def _partition_name(table: str, start: datetime) -> str:
+    return f"{table}_p{start:%Y%m%d}"
+
+
+def is_partitioned(db, table: str) -> bool:
+    """Является ли таблица секционированной"""
+    relkind = db.execute(text("SELECT relkind FROM pg_class WHERE relname = :table"), {"table": table}).scalar()
+    return relkind == "p"
+
+
+def get_partitions(db, table: str):
+    """Список секций таблицы (имя, начало, конец) по возрастанию, без секции по умолчанию"""
+    rows = db.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :table
+    """), {"table": table}).all()
+
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_RE.search(bound or "")
+        if match:
+            partitions.append((name, datetime.fromisoformat(match.group(1)), datetime.fromisoformat(match.group(2))))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def _default_partition(table: str) -> str:
+    return f"{table}_default"
+
+
+def create_partition(db, table: str, start: datetime, end: datetime):
+    """
+    Создает секцию [start, end), если ее еще нет. Строки этого периода, уже попавшие
+    в секцию по умолчанию, переносятся в новую секцию: иначе PostgreSQL не даст ее создать
+    """
+    name = _partition_name(table, start)
+    if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return
+
+    column = PARTITIONED_TABLES[table]
+    default = _default_partition(table)
+    bounds = {"start": start, "end": end}
+    move_rows = False
+    if db.execute(text("SELECT to_regclass(:name)"), {"name": default}).scalar() is not None:
+        move_rows = db.execute(text(
+            f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {column} >= :start AND {column} < :end)"
+        ), bounds).scalar()
+
+    if move_rows:
+        db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    db.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{start:%Y-%m-%d %H:%M:%S}') TO ('{end:%Y-%m-%d %H:%M:%S}')"
+    ))
+    if move_rows:
+        db.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {default} WHERE {column} >= :start AND {column} < :end RETURNING *
+            )
+            INSERT INTO {table} SELECT * FROM moved
+        """), bounds)
+        db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+
+
+def ensure_partitions(db, table: str, ahead: int = PARTITIONS_AHEAD, now: datetime = None):
+    """Создает секции на ahead интервалов вперед от текущего времени. Возвращает число созданных"""
+    partitions = get_partitions(db, table)
+    if not partitions:
+        return 0
+
+    _, last_start, last_end = partitions[-1]
+    step = last_end - last_start
+    until = (now or datetime.now()) + step * ahead
+
+    created = 0
+    start = last_end
+    while start < until:
+        create_partition(db, table, start, start + step)
+        start += step
+        created += 1
+    return created
+
+
+def enable_partitioning(db, table: str, interval: str = "day", ahead: int = PARTITIONS_AHEAD):
+    """
+    Преобразует обычную таблицу в секционированную по времени с переносом данных.
+    Выполняется в одной транзакции, на время переноса таблица заблокирована
+    """
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"Таблица {table} не поддерживает секционирование")
+    if interval not in PARTITION_INTERVALS:
+        raise ValueError(f"Неизвестный интервал секционирования: {interval}")
+    if is_partitioned(db, table):
+        return
+
+    column = PARTITIONED_TABLES[table]
+    step = PARTITION_INTERVALS[interval]
+    old_table = f"{table}_unpartitioned"
+
+    # Представления ссылаются на старую таблицу и не дадут ее удалить - пересоздаются после переноса
+    dropped_views = materialized.drop_materialized_views(db, table)
+    db.execute(text(f"ALTER TABLE {table} RENAME TO {old_table}"))
+    db.execute(text(
+        f"CREATE TABLE {table} (LIKE {old_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE ({column})"
+    ))
+
+    # Секции покрывают существующие данные и ahead интервалов вперед
+    min_time, max_time = db.execute(text(f"SELECT min({column}), max({column}) FROM {old_table}")).first()
+    now = datetime.now()
+    start = _interval_start(min_time or now, interval)
+    until = max(max_time or now, now) + step * ahead
+    while start < until:
+        create_partition(db, table, start, start + step)
+        start += step
+    # Секция по умолчанию, чтобы запись не падала при отсутствии нужной секции.
+    # Попавшие в нее строки переносятся в секцию при ее создании (create_partition)
+    db.execute(text(f"CREATE TABLE {_default_partition(table)} PARTITION OF {table} DEFAULT"))
+
+    db.execute(text(f"INSERT INTO {table} SELECT * FROM {old_table}"))
+    # Последовательность id должна пережить удаление старой таблицы
+    db.execute(text(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id"))
+    db.execute(text(f"DROP TABLE {old_table}"))
+
+    # Первичный ключ обязан включать ключ секционирования
+    db.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY (id, {column})"))
+    model_table = Base.metadata.tables[table]
+    for constraint in model_table.foreign_key_constraints:
+        db.execute(AddConstraint(constraint))
+    for index in model_table.indexes:
+        db.execute(CreateIndex(index))
+    if dropped_views:
+        materialized.create_materialized_views(db)
+
+
+def drop_partitions_older_than(db, table: str, cutoff: datetime, before_drop=None):
+    """
+    Отсоединяет и удаляет секции, целиком лежащие раньше cutoff. Возвращает число удаленных строк.
+    before_drop(db, имя секции) вызывается перед удалением каждой секции
+    """
+    deleted = 0
+    for name, _, end in get_partitions(db, table):
+        if end > cutoff:
+            break
+        if before_drop:
+            before_drop(db, name)
+        deleted += db.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+        db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        db.execute(text(f"DROP TABLE {name}"))
+    return deleted
@@ -1,8 +1,62 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_, or_, case
+from sqlalchemy import func, and_, or_, case, insert, select, literal, text, Integer
 from typing import List, Tuple
 from datetime import datetime, timedelta
 import models
+from crud import SHIFT_START_HOUR, SHIFT_HOURS, bucket_start, ActivityCRUD, unit_of_work
+import materialized
+
+# Шаблон названий видов деятельности "ремонт"
+REPAIR_ACTIVITY_PATTERN = '%чинит%'
+
+
+def _hours(hours):
+    return func.make_interval(0, 0, 0, 0, hours)
+
+
+def _helmet_rollup_name(bucket: str) -> str:
+    """Имя helmet_compliance_rollup в materialized_view_refresh (время обновления по виду интервала)"""
+    return f"helmet_compliance_rollup_{bucket}"
+
+
+def _bucket_start_expr(column, bucket: str):
+    """SQL-выражение начала интервала (minute, hour, shift), в который попадает column"""
+    if bucket in ("minute", "hour"):
+        return func.date_trunc(bucket, column)
+    if bucket == "shift":
+        shifted = column - _hours(SHIFT_START_HOUR)
+        shift_number = func.floor(func.extract('hour', shifted) / SHIFT_HOURS).cast(Integer)
+        return func.date_trunc('day', shifted) + _hours(shift_number * SHIFT_HOURS + SHIFT_START_HOUR)
+    raise ValueError(f"Неизвестный интервал: {bucket}")
+
+
+def activity_counts_query(moment):
+    """
+    Количество работников по видам деятельности, начатым в момент moment
+    (значение или bindparam): строки (activity_name, workers_count)
+    """
+    workers_count = func.count(models.WorkerActivity.id).label('workers_count')
+    return select(
+        models.Activity.name.label('activity_name'),
+        workers_count
+    ).join(models.WorkerActivity).where(
+        models.WorkerActivity.start_time == moment
+    ).group_by(models.Activity.name).order_by(workers_count.desc(), models.Activity.name)
+
+
+def uniform_counts_query(moment):
+    """
+    Количество работников по цвету униформы среди появившихся в момент moment
+    (значение или bindparam): строки (uniform_color, workers_count)
+    """
+    workers_count = func.count(models.Worker.id).label('workers_count')
+    return select(
+        models.Uniform.color.label('uniform_color'),
+        workers_count
+    ).join(models.Worker).where(
+        models.Worker.appearance_time == moment
+    ).group_by(models.Uniform.color).order_by(workers_count.desc(), models.Uniform.color)
+
 
 class AnalysisQueries:
     """Класс для выполнения аналитических запросов из описания"""
@@ -13,21 +67,35 @@ class AnalysisQueries:
         """
         Запрос 1: Найти всех работников, которые чинили поезд №XXX с 14:00 до 15:00
         """
-        return db.query(models.Worker).join(models.Train).join(models.WorkerActivity).join(models.Activity).filter(
+        repair_activity_ids = ActivityCRUD.resolve_activity_ids(db, REPAIR_ACTIVITY_PATTERN)
+        if not repair_activity_ids:
+            return []
+
+        return db.query(models.Worker).join(models.Train).join(models.WorkerActivity).filter(
             and_(
                 models.Train.train_number == train_number,
-                models.Activity.name.ilike('%чинит%'),
-                models.WorkerActivity.start_time <= end_time,
-                models.WorkerActivity.end_time >= start_time
+                models.WorkerActivity.activity_id.in_(repair_activity_ids),
+                models.overlaps(models.WorkerActivity.start_time, models.WorkerActivity.end_time, start_time, end_time),
+                models.WorkerActivity.end_time.isnot(None)
             )
         ).all()
 
     @staticmethod
-    def calculate_activity_time_by_uniform(db: Session, activity_name: str):
+    def calculate_activity_time_by_uniform(db: Session, activity_name: str, max_staleness: timedelta = None):
         """
         Запрос 2: Посчитать общее время, затраченное каждым сотрудником 
-        (по цвету униформы) на конкретный вид деятельности
+        (по цвету униформы) на конкретный вид деятельности.
+        max_staleness - читать из материализованного представления, данные в котором
+        не старше max_staleness (при необходимости оно обновляется); None - считать по таблицам.
+        Если устаревшее представление сейчас обновляет другой процесс, результат считается по таблицам
         """
+        if max_staleness is not None and materialized.ensure_fresh(
+                db, materialized.ACTIVITY_TIME_BY_UNIFORM.name, max_staleness):
+            view = materialized.activity_time_by_uniform_view
+            return db.execute(
+                select(view.c.color, view.c.total_seconds).where(view.c.activity_name == activity_name)
+            ).all()
+
         return db.query(
             models.Uniform.color,
             func.sum(
@@ -38,40 +106,195 @@ class AnalysisQueries:
         ).group_by(models.Uniform.color).all()
 
     @staticmethod
-    def get_workers_presence_timeline(db: Session, train_id: int, hours: int = 24):
+    def get_workers_presence_timeline(db: Session, train_id: int, hours: int = 24, include_open: bool = False):
         """
-        Запрос 3: Построить график присутствия сотрудников в кадре вокруг поезда
+        Запрос 3: Построить график присутствия сотрудников в кадре вокруг поезда.
+        include_open=True - включать работников, которые еще в кадре (disappearance_time = NULL)
         """
         end_time = datetime.now()
         start_time = end_time - timedelta(hours=hours)
         
+        conditions = [
+            models.Worker.train_id == train_id,
+            models.overlaps(models.Worker.appearance_time, models.Worker.disappearance_time, start_time, end_time)
+        ]
+        if not include_open:
+            conditions.append(models.Worker.disappearance_time.isnot(None))
+
         return db.query(
             models.Worker.appearance_time,
             models.Worker.disappearance_time,
             models.Uniform.color,
             models.Worker.helmet_on
         ).join(models.Uniform).filter(
-            and_(
-                models.Worker.train_id == train_id,
-                models.Worker.appearance_time <= end_time,
-                models.Worker.disappearance_time >= start_time
-            )
+            and_(*conditions)
         ).order_by(models.Worker.appearance_time).all()
 
     @staticmethod
-    def calculate_helmet_usage_percentage(db: Session):
+    def get_depot_presence_timeline(db: Session, hours: int = 24, include_open: bool = True):
         """
-        Запрос 4: Определить процент работников, которые в течение смены надевали каску
+        Присутствие сотрудников вокруг всех поездов депо одним запросом
+        (train_id, appearance_time, disappearance_time, color, helmet_on)
         """
-        total_workers = db.query(func.count(models.Worker.id)).scalar()
-        workers_with_helmet = db.query(func.count(models.Worker.id)).filter(
-            models.Worker.helmet_on == True
-        ).scalar()
-        
+        end_time = datetime.now()
+        start_time = end_time - timedelta(hours=hours)
+
+        conditions = [
+            models.overlaps(models.Worker.appearance_time, models.Worker.disappearance_time, start_time, end_time)
+        ]
+        if not include_open:
+            conditions.append(models.Worker.disappearance_time.isnot(None))
+
+        return db.query(
+            models.Worker.train_id,
+            models.Worker.appearance_time,
+            models.Worker.disappearance_time,
+            models.Uniform.color,
+            models.Worker.helmet_on
+        ).join(models.Uniform).filter(
+            and_(*conditions)
+        ).all()
+
+    @staticmethod
+    def get_latest_time(db: Session):
+        """Последнее время появления работника или начала активности (по индексам)"""
+        return db.execute(select(func.greatest(
+            select(func.max(models.Worker.appearance_time)).scalar_subquery(),
+            select(func.max(models.WorkerActivity.start_time)).scalar_subquery()
+        ))).scalar()
+
+    @staticmethod
+    def get_activity_counts(db: Session, moment: datetime = None):
+        """
+        Занятость сотрудников: количество по видам деятельности на момент moment
+        (по умолчанию - последнее время). Список (activity_name, workers_count)
+        """
+        moment = moment or AnalysisQueries.get_latest_time(db)
+        if moment is None:
+            return []
+        return db.execute(activity_counts_query(moment)).all()
+
+    @staticmethod
+    def get_uniform_counts(db: Session, moment: datetime = None):
+        """
+        Униформа: количество работников по цвету униформы на момент moment
+        (по умолчанию - последнее время). Список (uniform_color, workers_count)
+        """
+        moment = moment or AnalysisQueries.get_latest_time(db)
+        if moment is None:
+            return []
+        return db.execute(uniform_counts_query(moment)).all()
+
+    @staticmethod
+    def calculate_helmet_usage_percentage(db: Session, start_time: datetime = None, end_time: datetime = None):
+        """
+        Запрос 4: Определить процент работников, которые в течение смены надевали каску.
+        Один проход по таблице; start_time/end_time ограничивают период по времени появления
+        """
+        query = db.query(
+            func.count(models.Worker.id),
+            func.count(models.Worker.id).filter(models.Worker.helmet_on == True)
+        )
+        if start_time is not None:
+            query = query.filter(models.Worker.appearance_time >= start_time)
+        if end_time is not None:
+            query = query.filter(models.Worker.appearance_time < end_time)
+        total_workers, workers_with_helmet = query.one()
+
         if total_workers > 0:
             return (workers_with_helmet / total_workers) * 100
         return 0
 
+    @staticmethod
+    def get_helmet_compliance(db: Session, start_time: datetime, end_time: datetime,
+                              bucket: str = "shift", max_staleness: timedelta = None):
+        """
+        Использование касок по поездам, униформам и интервалам (minute, hour, shift):
+        (train_id, uniform_id, bucket_start, total_workers, helmet_workers).
+        max_staleness - читать из предагрегированной таблицы helmet_compliance_rollup, данные в которой
+        не старше max_staleness (при необходимости она обновляется); None - считать по таблицам.
+        Если устаревшую таблицу сейчас обновляет другой процесс, результат считается по таблицам
+        """
+        if max_staleness is not None and AnalysisQueries.ensure_helmet_rollup_fresh(db, bucket, max_staleness):
+            rollup = models.HelmetComplianceRollup
+            return db.query(
+                rollup.train_id, rollup.uniform_id, rollup.bucket_start,
+                rollup.total_workers, rollup.helmet_workers
+            ).filter(
+                and_(
+                    rollup.bucket == bucket,
+                    rollup.bucket_start >= bucket_start(start_time, bucket),
+                    rollup.bucket_start < end_time
+                )
+            ).order_by(rollup.bucket_start, rollup.train_id, rollup.uniform_id).all()
+
+        bucket_column = _bucket_start_expr(models.Worker.appearance_time, bucket).label('bucket_start')
+        return db.query(
+            models.Worker.train_id,
+            models.Worker.uniform_id,
+            bucket_column,
+            func.count(models.Worker.id).label('total_workers'),
+            func.count(models.Worker.id).filter(models.Worker.helmet_on == True).label('helmet_workers')
+        ).filter(
+            and_(
+                models.Worker.appearance_time >= bucket_start(start_time, bucket),
+                models.Worker.appearance_time < end_time
+            )
+        ).group_by(
+            models.Worker.train_id, models.Worker.uniform_id, bucket_column
+        ).order_by(bucket_column, models.Worker.train_id, models.Worker.uniform_id).all()
+
+    @staticmethod
+    def refresh_helmet_compliance_rollup(db: Session, since: datetime = None, bucket: str = "shift"):
+        """
+        Пересчитывает предагрегированную статистику касок начиная с интервала, содержащего since
+        (по умолчанию - текущий интервал). Закрытые интервалы пересчитывать не нужно.
+        Время обновления записывается в materialized_view_refresh (см. ensure_helmet_rollup_fresh)
+        """
+        rollup = models.HelmetComplianceRollup
+        started = datetime.now()
+        first_bucket = bucket_start(since or started, bucket)
+        bucket_column = _bucket_start_expr(models.Worker.appearance_time, bucket)
+
+        with unit_of_work(db):
+            db.query(rollup).filter(
+                and_(rollup.bucket == bucket, rollup.bucket_start >= first_bucket)
+            ).delete(synchronize_session=False)
+            db.execute(insert(rollup).from_select(
+                ["train_id", "uniform_id", "bucket", "bucket_start", "total_workers", "helmet_workers"],
+                select(
+                    models.Worker.train_id,
+                    models.Worker.uniform_id,
+                    literal(bucket),
+                    bucket_column,
+                    func.count(models.Worker.id),
+                    func.count(models.Worker.id).filter(models.Worker.helmet_on == True)
+                ).where(
+                    models.Worker.appearance_time >= first_bucket
+                ).group_by(models.Worker.train_id, models.Worker.uniform_id, bucket_column)
+            ))
+            materialized.mark_refreshed(db, _helmet_rollup_name(bucket), started)
+
+    @staticmethod
+    def ensure_helmet_rollup_fresh(db: Session, bucket: str, max_staleness: timedelta) -> bool:
+        """
+        Обновляет helmet_compliance_rollup, если данные в ней старше max_staleness: с интервала
+        прошлого обновления, а при первом обновлении - со всей истории.
+        Возвращает False, если таблица устарела, а ее сейчас обновляет другой процесс
+        """
+        name = _helmet_rollup_name(bucket)
+        staleness = materialized.get_staleness(db, name)
+        if staleness is not None and staleness <= max_staleness:
+            return True
+        if not db.execute(text("SELECT pg_try_advisory_xact_lock(hashtext(:name))"), {"name": name}).scalar():
+            return False
+        if staleness is not None:
+            since = datetime.now() - staleness
+        else:
+            since = db.query(func.min(models.Worker.appearance_time)).scalar()
+        AnalysisQueries.refresh_helmet_compliance_rollup(db, since, bucket)
+        return True
+
     @staticmethod
     def get_worker_activity_timeline(db: Session, worker_id: int):
         """
@@ -87,10 +310,18 @@ class AnalysisQueries:
         ).order_by(models.WorkerActivity.start_time).all()
 
     @staticmethod
-    def get_busiest_trains(db: Session, limit: int = 10):
+    def get_busiest_trains(db: Session, limit: int = 10, max_staleness: timedelta = None):
         """
-        Найти поезда с наибольшим количеством работников
+        Найти поезда с наибольшим количеством работников.
+        max_staleness - читать из материализованного представления (см. calculate_activity_time_by_uniform)
         """
+        if max_staleness is not None and materialized.ensure_fresh(db, materialized.BUSIEST_TRAINS.name, max_staleness):
+            view = materialized.busiest_trains_view
+            return db.execute(
+                select(view.c.train_number, view.c.workers_count)
+                .order_by(view.c.workers_count.desc()).limit(limit)
+            ).all()
+
         return db.query(
             models.Train.train_number,
             func.count(models.Worker.id).label('workers_count')
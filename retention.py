@@ -0,0 +1,139 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from datetime import datetime, timedelta
+import time
+import crud
+import partitioning
+
+# Сколько строк удалять за один запрос (каждая пачка - отдельная короткая транзакция)
+RETENTION_BATCH_SIZE = 5000
+
+
+class RetentionPolicy:
+    """
+    Политика хранения для таблицы: удалять строки старше max_age
+    и/или оставлять не больше max_rows самых новых строк
+    """
+
+    def __init__(self, table: str, time_column: str, max_age: timedelta = None, max_rows: int = None,
+                 before_delete=None):
+        self.table = table
+        self.time_column = time_column
+        self.max_age = max_age
+        self.max_rows = max_rows
+        # before_delete(db, ids) вызывается в транзакции удаления перед DELETE пачки
+        self.before_delete = before_delete
+
+    def __repr__(self):
+        return f"<RetentionPolicy(table='{self.table}', max_age={self.max_age}, max_rows={self.max_rows})>"
+
+
+# Политики по умолчанию. Дочерние строки (worker_activities, alerts) удаляются
+# вместе с работником через ON DELETE CASCADE в БД, поэтому срок хранения workers
+# должен быть не меньше самого длинного срока дочерних таблиц (alerts - 365 дней),
+# иначе происшествия фактически хранятся столько же, сколько работники.
+# Удаляемые активности вычитаются из накопленных итогов mean_working_time
+DEFAULT_POLICIES = [
+    RetentionPolicy("workers", "appearance_time", max_age=timedelta(days=365),
+                    before_delete=crud.subtract_deleted_workers),
+    RetentionPolicy("worker_activities", "start_time", max_age=timedelta(days=90),
+                    before_delete=crud.subtract_deleted_activities),
+    RetentionPolicy("alerts", "alert_time", max_age=timedelta(days=365)),
+    RetentionPolicy("mean_working_time_history", "bucket_start", max_age=timedelta(days=365)),
+    RetentionPolicy("helmet_compliance_rollup", "bucket_start", max_age=timedelta(days=365)),
+]
+
+
+def _delete_batches(db: Session, policy: RetentionPolicy, condition: str, params: dict, batch_size: int):
+    """Удаляет строки по условию пачками, commit после каждой пачки. Возвращает число удаленных строк"""
+    # SKIP LOCKED - не ждем строки, которые сейчас изменяет запись данных.
+    # Выбранные строки остаются заблокированными до commit пачки
+    select_ids = text(f"""
+        SELECT id FROM {policy.table}
+        WHERE {condition}
+        ORDER BY {policy.time_column}, id
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    """)
+    delete = text(f"DELETE FROM {policy.table} WHERE id = ANY(:ids)")
+    deleted = 0
+    while True:
+        ids = [row_id for (row_id,) in db.execute(select_ids, {**params, "batch_size": batch_size})]
+        if ids:
+            if policy.before_delete:
+                policy.before_delete(db, ids)
+            deleted += db.execute(delete, {"ids": ids}).rowcount
+        db.commit()
+        if len(ids) < batch_size:
+            return deleted
+
+
+def _before_drop_partition(policy: RetentionPolicy):
+    """Хук удаления секции: передает before_delete все строки секции"""
+    if policy.before_delete is None:
+        return None
+
+    def before_drop(db, partition: str):
+        policy.before_delete(db, [row_id for (row_id,) in db.execute(text(f"SELECT id FROM {partition}"))])
+    return before_drop
+
+
+def _count_cutoff(db: Session, policy: RetentionPolicy):
+    """(время, id) самой новой строки, которая не помещается в max_rows, или None"""
+    return db.execute(text(f"""
+        SELECT {policy.time_column}, id FROM {policy.table}
+        ORDER BY {policy.time_column} DESC, id DESC
+        OFFSET :max_rows LIMIT 1
+    """), {"max_rows": policy.max_rows}).first()
+
+
+def apply_policy(db: Session, policy: RetentionPolicy, batch_size: int = RETENTION_BATCH_SIZE, now: datetime = None):
+    """Применяет политику хранения к таблице. Возвращает статистику удаления"""
+    started = time.perf_counter()
+    deleted = 0
+
+    if policy.max_age is not None:
+        cutoff_time = (now or datetime.now()) - policy.max_age
+        if partitioning.is_partitioned(db, policy.table):
+            # Целиком устаревшие секции удаляются без построчного DELETE
+            deleted += partitioning.drop_partitions_older_than(
+                db, policy.table, cutoff_time, before_drop=_before_drop_partition(policy)
+            )
+            db.commit()
+        deleted += _delete_batches(
+            db, policy, f"{policy.time_column} < :cutoff_time",
+            {"cutoff_time": cutoff_time}, batch_size
+        )
+
+    if policy.max_rows is not None:
+        cutoff = _count_cutoff(db, policy)
+        db.commit()
+        if cutoff is not None:
+            deleted += _delete_batches(
+                db, policy, f"({policy.time_column}, id) <= (:cutoff_time, :cutoff_id)",
+                {"cutoff_time": cutoff[0], "cutoff_id": cutoff[1]}, batch_size
+            )
+
+    seconds = time.perf_counter() - started
+    return {
+        "table": policy.table,
+        "deleted": deleted,
+        "seconds": seconds,
+        "rows_per_second": deleted / seconds if seconds > 0 else 0.0,
+    }
+
+
+def apply_policies(db: Session, policies=None, batch_size: int = RETENTION_BATCH_SIZE, now: datetime = None):
+    """Применяет все политики хранения по очереди и выводит отчет"""
+    reports = []
+    for policy in policies if policies is not None else DEFAULT_POLICIES:
+        try:
+            report = apply_policy(db, policy, batch_size, now)
+        except Exception as e:
+            db.rollback()
+            print(f"Ошибка при очистке таблицы {policy.table}: {e}")
+            continue
+        reports.append(report)
+        print(f"{report['table']}: удалено {report['deleted']} строк "
+              f"за {report['seconds']:.2f} с ({report['rows_per_second']:.0f} строк/с)")
+    return reports
@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta
+import math
+import random
+import sys
+from sqlalchemy.orm import Session
+from database import get_session, get_engine, create_tables
+import crud
+
+# Одинаковые seed и end_time дают одинаковые данные
+SEED = 42
+
+# Поездов, прибывающих в депо за сутки: определяет длину сгенерированного периода
+TRAINS_PER_DAY = 40
+# Поездов в одной пачке генерации (поезда, их работники, активности и происшествия)
+TRAIN_BATCH = 500
+
+# Среднее количество работников у поезда и активностей за время присутствия работника
+WORKERS_PER_TRAIN = 8
+ACTIVITIES_PER_WORKER = 4
+# Доля работников, с которыми произошло происшествие
+ALERT_RATE = 0.05
+# Доля работников в каске
+HELMET_RATE = 0.85
+
+# Стоянка поезда и присутствие работника: логнормальное распределение (медиана в часах, разброс)
+DWELL_HOURS = (4.0, 0.5)
+PRESENCE_HOURS = (1.5, 0.6)
+
+# "работает" создается первым: его id совпадает с crud.WORKING_ACTIVITY_ID
+ACTIVITIES = [
+    ("работает", "ремонтные работы", 0.6),
+    ("не работает", "сотрудник не работает", 0.15),
+    ("чинит тормоза", "ремонт тормозной системы", 0.15),
+    ("чинит двери", "ремонт дверей", 0.1),
+]
+UNIFORMS = [("синий", 0.4), ("серый", 0.3), ("белый", 0.2), ("униформа отсутствует", 0.1)]
+ALERTS = [
+    ("человек на путях", "Человек находится на путях"),
+    ("падение на рельсы", "Сотрудник упал на рельсы при осмотре поезда"),
+    ("отсутствие защитной экипировки", "Сотрудник работает без каски в опасной зоне"),
+    ("нарушение техники безопасности", "Сотрудник пересек ограничительную линию без разрешения"),
+]
+
+
+def _lognormal_hours(rng: random.Random, params) -> timedelta:
+    median, sigma = params
+    return timedelta(hours=rng.lognormvariate(math.log(median), sigma))
+
+
+def _shift_end(moment: datetime) -> datetime:
+    return crud.bucket_start(moment, "shift") + timedelta(hours=crud.SHIFT_HOURS)
+
+
+def _train_records(rng: random.Random, count: int, first_number: int, start: datetime, end: datetime):
+    span = (end - start).total_seconds()
+    trains = []
+    for number in range(first_number, first_number + count):
+        arrival = start + timedelta(seconds=rng.uniform(0, span))
+        departure = arrival + _lognormal_hours(rng, DWELL_HOURS)
+        trains.append({
+            "train_number": f"ЭС{number % 9 + 1}-{number:06d}",
+            "arrival_time": arrival,
+            "departure_time": departure if departure < end else None,  # поезд еще в депо
+        })
+    return trains
+
+
+def _worker_records(rng: random.Random, trains, train_ids, uniform_ids, uniform_weights, end: datetime):
+    """Работники поезда появляются во время стоянки и уходят не позже конца смены и отправления поезда"""
+    workers = []
+    for train, train_id in zip(trains, train_ids):
+        leave_limit = train["departure_time"] or end
+        dwell = (leave_limit - train["arrival_time"]).total_seconds()
+        for _ in range(rng.randint(1, 2 * WORKERS_PER_TRAIN - 1)):
+            appearance = train["arrival_time"] + timedelta(seconds=rng.uniform(0, dwell * 0.8))
+            disappearance = min(
+                appearance + _lognormal_hours(rng, PRESENCE_HOURS),
+                _shift_end(appearance),
+                leave_limit
+            )
+            workers.append({
+                "train_id": train_id,
+                "uniform_id": rng.choices(uniform_ids, uniform_weights)[0],
+                "helmet_on": rng.random() < HELMET_RATE,
+                "appearance_time": appearance,
+                "disappearance_time": disappearance if disappearance < end else None,  # еще в кадре
+            })
+    return workers
+
+
+def _activity_records(rng: random.Random, workers, worker_ids, activity_ids, activity_weights, end: datetime):
+    """Присутствие работника делится на последовательные активности без пропусков"""
+    activities = []
+    for worker, worker_id in zip(workers, worker_ids):
+        start = worker["appearance_time"]
+        finish = worker["disappearance_time"] or end
+        length = (finish - start).total_seconds()
+        count = rng.randint(1, 2 * ACTIVITIES_PER_WORKER - 1)
+        cuts = sorted(rng.uniform(0, length) for _ in range(count - 1))
+        bounds = [start] + [start + timedelta(seconds=cut) for cut in cuts] + [worker["disappearance_time"]]
+        for segment_start, segment_end in zip(bounds, bounds[1:]):
+            activities.append({
+                "worker_id": worker_id,
+                "activity_id": rng.choices(activity_ids, activity_weights)[0],
+                "start_time": segment_start,
+                "end_time": segment_end,
+            })
+    return activities
+
+
+def _alert_records(rng: random.Random, workers, worker_ids, end: datetime):
+    alerts = []
+    for worker, worker_id in zip(workers, worker_ids):
+        if rng.random() >= ALERT_RATE:
+            continue
+        start = worker["appearance_time"]
+        finish = worker["disappearance_time"] or end
+        alert_type, message = rng.choice(ALERTS)
+        alerts.append({
+            "worker_id": worker_id,
+            "alert_type": alert_type,
+            "danger_message": message,
+            "alert_time": start + (finish - start) * rng.random(),
+        })
+    return alerts
+
+
+def generate(db: Session, trains: int, seed: int = SEED, end_time: datetime = None,
+             train_batch: int = TRAIN_BATCH):
+    """
+    Генерирует trains поездов с работниками, активностями и происшествиями за последние
+    trains / TRAINS_PER_DAY суток до end_time и записывает их через bulk_create_*.
+    Данные пишутся пачками по train_batch поездов, память не зависит от общего объема.
+    Возвращает количество созданных строк по таблицам
+    """
+    rng = random.Random(seed)
+    end = end_time or datetime.now().replace(second=0, microsecond=0)
+    start = end - timedelta(days=max(1.0, trains / TRAINS_PER_DAY))
+
+    activity_ids = [crud.ActivityCRUD.get_or_create_activity_id(db, name, description)
+                    for name, description, _ in ACTIVITIES]
+    activity_weights = [weight for _, _, weight in ACTIVITIES]
+    uniform_ids = [crud.UniformCRUD.get_or_create_uniform_id(db, color) for color, _ in UNIFORMS]
+    uniform_weights = [weight for _, weight in UNIFORMS]
+
+    counts = {"trains": 0, "workers": 0, "worker_activities": 0, "alerts": 0}
+    for first in range(0, trains, train_batch):
+        train_rows = _train_records(rng, min(train_batch, trains - first), first + 1, start, end)
+        train_ids = crud.TrainCRUD.bulk_create_trains(db, train_rows, return_ids=True)
+
+        worker_rows = _worker_records(rng, train_rows, train_ids, uniform_ids, uniform_weights, end)
+        worker_ids = crud.WorkerCRUD.bulk_create_workers(db, worker_rows, return_ids=True)
+
+        activity_rows = _activity_records(rng, worker_rows, worker_ids, activity_ids, activity_weights, end)
+        crud.WorkerActivityCRUD.bulk_create_worker_activities(db, activity_rows)
+
+        alert_rows = _alert_records(rng, worker_rows, worker_ids, end)
+        crud.AlertCRUD.bulk_create_alerts(db, alert_rows)
+
+        counts["trains"] += len(train_rows)
+        counts["workers"] += len(worker_rows)
+        counts["worker_activities"] += len(activity_rows)
+        counts["alerts"] += len(alert_rows)
+    return counts
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else SEED
+    engine = get_engine()
+    create_tables(engine)
+    session = get_session(engine)
+    try:
+        print(generate(session, count, seed))
+    finally:
+        session.close()
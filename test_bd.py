@@ -2,8 +2,20 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 import psycopg2
+import json
+import io
+import hashlib
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from streamlit_autorefresh import st_autorefresh
 from matplotlib.ticker import MaxNLocator
+from instrumentation import QUERY_STATS_FILE
+from lru import LRUCache
+from dashboard_sql import (
+    WATERMARK_SQL, LATEST_TIME_SQL, ACTIVITY_COUNTS_SQL, UNIFORM_COUNTS_SQL, MEAN_TIME_SQL, ALERTS_SQL,
+    history_params
+)
 
 def custom_info(message, background_color="#fdf0b6", text_color="#000000", border_color="#ffd200"):
     st.markdown(
@@ -36,97 +48,205 @@ DB_NAME = "depot_analysis"
 DB_USER = "depot_user"
 DB_PASS = "depotpassword"
 
-# Загрузка данных
-@st.cache_data(ttl=0)
-def load_data():
+# Как часто (в секундах) проверять, изменились ли данные в БД
+WATERMARK_TTL = 1
+
+# Период и количество точек графика среднего времени активности
+HISTORY_HOURS = 24
+HISTORY_MAX_POINTS = 300
+
+# Панель статистики SQL-запросов из снимка, который выгружает сервис
+# (instrumentation.query_stats.export_snapshot); сколько самых затратных запросов показывать
+SHOW_QUERY_STATS = False
+QUERY_STATS_TOP = 20
+
+# Один пул соединений на процесс, общий для всех сессий Streamlit
+@st.cache_resource
+def get_connection_pool():
+    return ThreadedConnectionPool(
+        1, 4,
+        host=DB_HOST,
+        port=DB_PORT,
+        database=DB_NAME,
+        user=DB_USER,
+        password=DB_PASS
+    )
+
+@contextmanager
+def pooled_connection():
+    pool = get_connection_pool()
+    conn = pool.getconn()
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            database=DB_NAME,
-            user=DB_USER,
-            password=DB_PASS
-        )
+        conn.autocommit = True  # только чтение, без открытых транзакций
+        yield conn
+    finally:
+        pool.putconn(conn)
 
-        # Загрузка ВСЕХ данных о работниках и активностях
-        workers_raw = pd.read_sql_query(
-            """
-            SELECT 
-                w.id,
-                u.color AS uniform_color,
-                w.appearance_time
-            FROM workers w
-            LEFT JOIN uniforms u ON w.uniform_id = u.id
-            """,
-            conn,
-            parse_dates=["appearance_time"]
-        )
+# Водяной знак: дешевый запрос по индексам, меняется только при изменении данных.
+# Результат общий для всех зрителей и живет WATERMARK_TTL секунд
+@st.cache_data(ttl=WATERMARK_TTL, show_spinner=False)
+def load_watermark():
+    with pooled_connection() as conn, conn.cursor() as cur:
+        cur.execute(WATERMARK_SQL)
+        return tuple(cur.fetchone())
 
-        activities_raw = pd.read_sql_query(
-            """
-            SELECT 
-                wa.worker_id,
-                a.name AS activity_name,
-                wa.start_time
-            FROM worker_activities wa
-            JOIN activities a ON wa.activity_id = a.id
-            """,
+# Снимок данных пересчитывается одним вызовом на каждое новое значение водяного знака
+# и переиспользуется всеми сессиями
+@st.cache_data(max_entries=2, show_spinner=False)
+def load_snapshot(watermark):
+    with pooled_connection() as conn:
+        # Последнее время появления считается в БД (max по индексам appearance_time и start_time)
+        latest_df = pd.read_sql_query(LATEST_TIME_SQL, conn)
+        latest_time = latest_df['latest_time'].iloc[0]
+        latest_time = None if pd.isna(latest_time) else pd.Timestamp(latest_time).to_pydatetime()
+
+        # Занятость и униформа на последнее время: БД возвращает только счетчики по группам
+        activity_counts_df = pd.read_sql_query(
+            ACTIVITY_COUNTS_SQL,
             conn,
-            parse_dates=["appearance_time"]
+            params={"latest_time": latest_time}
         )
 
-        # Преобразуем временные метки в datetime (на случай, если parse_dates не сработало)
-        workers_raw['appearance_time'] = pd.to_datetime(workers_raw['appearance_time'])
-        activities_raw['start_time'] = pd.to_datetime(activities_raw['start_time'])
-
-        # Найти последнее время появления
-        latest_time = max(
-            workers_raw['appearance_time'].max(),
-            activities_raw['start_time'].max()
+        uniform_counts_df = pd.read_sql_query(
+            UNIFORM_COUNTS_SQL,
+            conn,
+            params={"latest_time": latest_time}
         )
 
-        # Отфильтровать только записи с этим временем
-        workers_df = workers_raw[workers_raw['appearance_time'] == latest_time].copy()
-        activities_df = activities_raw[activities_raw['start_time'] == latest_time].copy()
-
-        # Форматирование времени для отображения (если нужно где-то показывать)
-        workers_df['appearance_time'] = workers_df['appearance_time'].dt.strftime("%Y-%m-%d %H:%M:%S")
-        activities_df['start_time'] = activities_df['start_time'].dt.strftime("%Y-%m-%d %H:%M:%S")
-
-        # Загрузка исторических данных о среднем времени активности
+        # Загрузка истории среднего времени активности из предагрегированной таблицы,
+        # не больше HISTORY_MAX_POINTS точек за последние HISTORY_HOURS часов
         mean_time_df = pd.read_sql_query(
-            """
-            SELECT last_updated, mean_seconds
-            FROM mean_working_time
-            ORDER BY last_updated
-            """,
+            MEAN_TIME_SQL,
             conn,
-            parse_dates=["last_updated"]
+            params=history_params(HISTORY_HOURS, HISTORY_MAX_POINTS),
+            parse_dates=["point_time"]
         )
-        mean_time_df['last_updated'] = pd.to_datetime(mean_time_df['last_updated'])
+        mean_time_df['point_time'] = pd.to_datetime(mean_time_df['point_time'])
 
         # Загрузка предупреждений
         alerts_df = pd.read_sql_query(
-            """
-            SELECT 
-                alert_type,
-                danger_message,
-                alert_time
-            FROM alerts
-            WHERE alert_type = 'человек на путях' AND alert_time >= NOW() - INTERVAL '1 minutes'
-            ORDER BY alert_time DESC
-            """,
+            ALERTS_SQL,
             conn,
             parse_dates=["alert_time"]
         )
 
-        conn.close()
-        return workers_df, activities_df, mean_time_df, alerts_df
+        return activity_counts_df, uniform_counts_df, mean_time_df, alerts_df
 
+@st.cache_data(ttl=WATERMARK_TTL, show_spinner=False)
+def load_query_stats():
+    try:
+        with open(QUERY_STATS_FILE, encoding="utf-8") as stats_file:
+            return json.load(stats_file)
+    except (OSError, ValueError):
+        return None
+
+# Загрузка данных
+def load_data():
+    try:
+        return load_snapshot(load_watermark())
     except Exception as e:
         st.error(f"Ошибка при загрузке базы данных: {e}")
         st.stop()
 
-workers_df, activities_df, mean_time_df, alerts_df = load_data()
+# Готовые графики (PNG) кэшируются по хэшу входных данных и переиспользуются
+# всеми сессиями; перерисовка происходит только при изменении данных
+CHART_CACHE_SIZE = 32
+CHART_DPI = 200
+
+
+@st.cache_resource
+def get_chart_cache():
+    """Кэш графиков: ключ -> PNG"""
+    return LRUCache(CHART_CACHE_SIZE)
+
+def _chart_key(name, data):
+    """Ключ графика: его имя, столбцы и хэш содержимого входных данных"""
+    columns = list(data.columns) if isinstance(data, pd.DataFrame) else [data.name]
+    digest = hashlib.sha1(f"{name}:{columns}".encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    return digest.hexdigest()
+
+def cached_chart(name, data, render):
+    """PNG графика render(data) из кэша; при промахе график строится и сохраняется"""
+    cache = get_chart_cache()
+    key = _chart_key(name, data)
+    png = cache.get(key)
+    if png is None:
+        fig = render(data)
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format="png", dpi=CHART_DPI, bbox_inches="tight")
+        plt.close(fig)
+        png = buffer.getvalue()
+        cache.put(key, png)
+    return png
+
+def render_activity_pie(activity_counts):
+    labels = activity_counts.index.tolist()
+    sizes = activity_counts.values.tolist()
+    colors = ['#fcaf17', '#6b6b6b'] 
+
+    fig, ax = plt.subplots(figsize=(4, 4))
+    wedges, _ = ax.pie(
+        sizes,
+        labels=None,
+        colors=colors[:len(sizes)],
+        startangle=90,
+        wedgeprops=dict(width=0.5)
+    )
+    ax.text(
+        0, 0,
+        str(int(activity_counts.sum())),
+        horizontalalignment='center',
+        verticalalignment='center',
+        fontsize=20,
+        fontweight='bold',
+        color='black'
+    )
+    ax.axis('equal')
+    ax.legend(
+        wedges, labels,
+        title="Активность",
+        loc="center left",
+        bbox_to_anchor=(1, 0, 0.5, 1)
+    )
+    plt.tight_layout()
+    return fig
+
+def render_uniform_bar(uniform_counts):
+    fig, ax = plt.subplots(figsize=(4, 4))
+    colors = ['#c20937' if cat == "Нет униформы" else '#ffd200' for cat in uniform_counts.index]
+    ax.bar(uniform_counts.index, uniform_counts.values, width=0.6, color=colors)
+    ax.set_xlabel("Цвет униформы")
+    ax.set_ylabel("Количество сотрудников")
+    ax.yaxis.set_major_locator(MaxNLocator(integer=True)) # делаем шкалу количества целочисленной
+    ax.set_xlim(-0.8, len(uniform_counts.index) - 0.2)
+    ax.grid(True, alpha=0.5)
+    plt.xticks(rotation=45, ha='right')
+    plt.tight_layout()
+    return fig
+
+def render_mean_time(mean_time_df):
+    mean_time_df = mean_time_df.sort_values('point_time')
+    mean_minutes = mean_time_df['mean_seconds'] / 60.0
+
+    fig, ax = plt.subplots(figsize=(4, 4))
+    ax.plot(
+        mean_time_df['point_time'],
+        mean_minutes,
+        color='#f99d1c',
+        marker='o',
+        linewidth=2,
+        markersize=4
+    )
+    ax.set_xlabel("Время")
+    ax.set_ylabel("Среднее время активности (минуты)")
+    ax.set_title("Среднее время активности сотрудников во времени")
+    ax.grid(True, alpha=0.5)
+    plt.xticks(rotation=45)
+    plt.tight_layout()
+    return fig
+
+activity_counts_df, uniform_counts_df, mean_time_df, alerts_df = load_data()
 
 if not alerts_df.empty:
     latest_alert = alerts_df.iloc[0]
@@ -139,59 +259,18 @@ col1, col2, col3 = st.columns([1, 1, 1])
 # Колонка 1: Занятость (по активностям на latest_time)
 with col1:
     st.subheader("Занятость сотрудников")
-    if not activities_df.empty:
-        total_workers = len(activities_df)
-        activity_counts = activities_df['activity_name'].value_counts()
-        labels = activity_counts.index.tolist()
-        sizes = activity_counts.values.tolist()
-        colors = ['#fcaf17', '#6b6b6b'] 
-
-        fig, ax = plt.subplots(figsize=(4, 4))
-        wedges, _ = ax.pie(
-            sizes,
-            labels=None,
-            colors=colors[:len(sizes)],
-            startangle=90,
-            wedgeprops=dict(width=0.5)
-        )
-        ax.text(
-            0, 0,
-            str(total_workers),
-            horizontalalignment='center',
-            verticalalignment='center',
-            fontsize=20,
-            fontweight='bold',
-            color='black'
-        )
-        ax.axis('equal')
-        ax.legend(
-            wedges, labels,
-            title="Активность",
-            loc="center left",
-            bbox_to_anchor=(1, 0, 0.5, 1)
-        )
-        plt.tight_layout()
-        st.pyplot(fig)
+    if not activity_counts_df.empty:
+        activity_counts = activity_counts_df.set_index('activity_name')['workers_count']
+        st.image(cached_chart("activity_pie", activity_counts, render_activity_pie))
     else:
         custom_info("Нет данных об активности сотрудников")
 
-# Колонка 2: Униформа (по workers_df на latest_time)
+# Колонка 2: Униформа (по работникам на latest_time)
 with col2:
     st.subheader("Униформа")
-    if not workers_df.empty:
-        uniform_counts = workers_df['uniform_color'].value_counts().sort_values(ascending=False)
-
-        fig, ax = plt.subplots(figsize=(4, 4))
-        colors = ['#c20937' if cat == "Нет униформы" else '#ffd200' for cat in uniform_counts.index]
-        bars = ax.bar(uniform_counts.index, uniform_counts.values, width=0.6, color=colors)
-        ax.set_xlabel("Цвет униформы")
-        ax.set_ylabel("Количество сотрудников")
-        ax.yaxis.set_major_locator(MaxNLocator(integer=True)) # делаем шкалу количества целочисленной
-        ax.set_xlim(-0.8, len(uniform_counts.index) - 0.2)
-        ax.grid(True, alpha=0.5)
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-        st.pyplot(fig)
+    if not uniform_counts_df.empty:
+        uniform_counts = uniform_counts_df.set_index('uniform_color')['workers_count']
+        st.image(cached_chart("uniform_bar", uniform_counts, render_uniform_bar))
     else:
         custom_info("Нет данных о сотрудниках")
 
@@ -199,24 +278,24 @@ with col2:
 with col3:
     st.subheader("Среднее время активности сотрудников")
     if not mean_time_df.empty:
-        mean_time_df = mean_time_df.sort_values('last_updated')
-        mean_time_df['mean_minutes'] = mean_time_df['mean_seconds'] / 60.0
-
-        fig, ax = plt.subplots(figsize=(4, 4))
-        ax.plot(
-            mean_time_df['last_updated'],
-            mean_time_df['mean_minutes'],
-            color='#f99d1c',
-            marker='o',
-            linewidth=2,
-            markersize=4
-        )
-        ax.set_xlabel("Время")
-        ax.set_ylabel("Среднее время активности (минуты)")
-        ax.set_title("Среднее время активности сотрудников во времени")
-        ax.grid(True, alpha=0.5)
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        st.pyplot(fig)
+        st.image(cached_chart("mean_time_plot", mean_time_df, render_mean_time))
     else:
-        st.info("Нет данных о среднем времени активности.")
\ No newline at end of file
+        st.info("Нет данных о среднем времени активности.")
+
+# Статистика SQL-запросов
+if SHOW_QUERY_STATS:
+    with st.expander("Статистика SQL-запросов"):
+        query_stats = load_query_stats()
+        if query_stats is None:
+            custom_info(f"Снимок статистики запросов не найден: {QUERY_STATS_FILE}")
+        else:
+            st.caption(f"Собрано с {query_stats['started_at']}, выгружено {query_stats['exported_at']}")
+            statements_df = pd.DataFrame(query_stats["statements"])
+            if not statements_df.empty:
+                st.dataframe(statements_df[
+                    ["caller", "count", "total_ms", "avg_ms", "max_ms", "rows", "statement"]
+                ].head(QUERY_STATS_TOP))
+            slow_df = pd.DataFrame(query_stats["slow_queries"])
+            if not slow_df.empty:
+                st.subheader(f"Медленные запросы (дольше {query_stats['slow_query_ms']} мс)")
+                st.dataframe(slow_df[["time", "caller", "elapsed_ms", "statement", "parameters", "plan"]])
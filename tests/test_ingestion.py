@@ -0,0 +1,87 @@
+from datetime import datetime
+import pytest
+from ingestion import IngestionQueue
+
+# Запись в БД подменяется: проверяется только обработка пачек и Future потоком-писателем
+
+MOMENT = datetime(2024, 1, 1, 8)
+
+
+class _FakeWriter:
+    """Вместо записи в БД запоминает записи и выдает id по порядку"""
+
+    def __init__(self):
+        self.written = []
+
+    def __call__(self, batch):
+        ids = {}
+        for kind, record, _ in batch:
+            self.written.append(record)
+            ids.setdefault(kind, []).append(len(self.written))
+        return ids
+
+
+def _queue(writer):
+    ingestion = IngestionQueue(flush_interval=0.05)
+    ingestion._write = writer
+    return ingestion
+
+
+def test_cancelled_futures_are_skipped():
+    writer = _FakeWriter()
+    ingestion = _queue(writer)
+    futures = [ingestion.put_alert(1, "тест", str(i), MOMENT) for i in range(4)]
+    assert futures[1].cancel()
+
+    ingestion.start().stop()
+
+    assert [record["danger_message"] for record in writer.written] == ["0", "2", "3"]
+    assert [futures[i].result() for i in (0, 2, 3)] == [1, 2, 3]
+    assert futures[1].cancelled()
+    metrics = ingestion.metrics()
+    assert metrics["cancelled"] == 1
+    assert metrics["written"] == 3
+
+
+def test_writer_survives_failed_flush():
+    ingestion = _queue(_FakeWriter())
+    ingestion._flush = _failing_once(ingestion._flush)
+    ingestion.start()
+    try:
+        first = ingestion.put_alert(1, "тест", "первое", MOMENT)
+        with pytest.raises(RuntimeError):
+            first.result(timeout=5)
+        second = ingestion.put_alert(1, "тест", "второе", MOMENT)
+        assert second.result(timeout=5) == 1
+    finally:
+        ingestion.stop()
+    assert ingestion.metrics()["failed"] == 1
+
+
+def test_stop_skips_cancelled_futures():
+    ingestion = _queue(_FakeWriter())
+    futures = [ingestion.put_alert(1, "тест", str(i), MOMENT) for i in range(2)]
+    futures[0].cancel()
+
+    # Поток не запускался: stop только разбирает очередь
+    ingestion.stop()
+
+    assert futures[0].cancelled()
+    with pytest.raises(RuntimeError):
+        futures[1].result(timeout=0)
+    metrics = ingestion.metrics()
+    assert (metrics["cancelled"], metrics["failed"]) == (1, 1)
+
+
+def _failing_once(flush):
+    calls = []
+
+    def wrapper(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            # Ошибка вне _write_part (например, в учете метрик) после начала записи
+            for item in batch:
+                item[2].set_running_or_notify_cancel()
+            raise RuntimeError("сбой сброса")
+        return flush(batch)
+    return wrapper
@@ -0,0 +1,68 @@
+import instrumentation
+
+
+class _PgLikeConnection:
+    """
+    DBAPI-соединение с поведением транзакции PostgreSQL: после ошибки все запросы, кроме
+    ROLLBACK TO SAVEPOINT, отклоняются до отката
+    """
+
+    def __init__(self):
+        self.aborted = False
+        self.savepoints = []
+
+    def cursor(self):
+        return _PgLikeCursor(self)
+
+
+class _PgLikeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._rows = []
+
+    def execute(self, statement, parameters=None):
+        connection = self.connection
+        name = statement.split()[-1]
+        if statement.startswith("ROLLBACK TO SAVEPOINT"):
+            del connection.savepoints[connection.savepoints.index(name) + 1:]
+            connection.aborted = False
+            return
+        if connection.aborted:
+            raise RuntimeError("current transaction is aborted, commands ignored until end of transaction block")
+        if statement.startswith("SAVEPOINT"):
+            connection.savepoints.append(name)
+        elif statement.startswith("RELEASE SAVEPOINT"):
+            del connection.savepoints[connection.savepoints.index(name):]
+        elif "missing" in statement:
+            connection.aborted = True
+            raise RuntimeError('relation "missing" does not exist')
+        else:
+            self._rows = [("Seq Scan on workers",)]
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+def test_failed_explain_keeps_transaction_usable():
+    cursor = _PgLikeConnection().cursor()
+    cursor.execute("SELECT * FROM workers")
+
+    plan = instrumentation._explain(cursor, "SELECT * FROM missing", None)
+
+    assert plan.startswith("EXPLAIN не выполнен")
+    assert not cursor.connection.aborted
+    assert cursor.connection.savepoints == []
+    cursor.execute("SELECT * FROM workers")
+    assert cursor.fetchall() == [("Seq Scan on workers",)]
+
+
+def test_explain_releases_savepoint():
+    cursor = _PgLikeConnection().cursor()
+
+    plan = instrumentation._explain(cursor, "SELECT * FROM workers", None)
+
+    assert plan == "Seq Scan on workers"
+    assert cursor.connection.savepoints == []
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+import random
+import intervals
+from intervals import IntervalIndex
+
+BASE = datetime(2024, 1, 1)
+
+
+def _moment(rng):
+    return BASE + timedelta(minutes=rng.randint(0, 600))
+
+
+def _brute_at(live, moment):
+    return sorted(payload for start, end, payload in live.values()
+                  if start <= moment <= (intervals.OPEN_END if end is None else end))
+
+
+def _brute_overlapping(live, start, end):
+    return sorted(payload for item_start, item_end, payload in live.values()
+                  if item_start <= end and (intervals.OPEN_END if item_end is None else item_end) >= start)
+
+
+def test_static_index_matches_brute_force():
+    rng = random.Random(1)
+    live = {}
+    items = []
+    for payload in range(300):
+        start = _moment(rng)
+        end = None if rng.random() < 0.1 else start + timedelta(minutes=rng.randint(0, 120))
+        items.append((start, end, payload))
+        live[payload] = (start, end, payload)
+    index = IntervalIndex(items)
+
+    assert len(index) == len(items)
+    for _ in range(200):
+        moment = _moment(rng)
+        assert sorted(index.at(moment)) == _brute_at(live, moment)
+        assert index.count_at(moment) == len(_brute_at(live, moment))
+        start = _moment(rng)
+        end = start + timedelta(minutes=rng.randint(0, 90))
+        assert sorted(index.overlapping(start, end)) == _brute_overlapping(live, start, end)
+
+
+def test_add_remove_close_match_brute_force():
+    # Малый буфер, чтобы перестроения дерева происходили часто
+    rng = random.Random(2)
+    minimum = intervals.MIN_PENDING
+    intervals.MIN_PENDING = 4
+    try:
+        index = IntervalIndex()
+        live = {}
+        for step in range(2000):
+            action = rng.random()
+            if action < 0.5 or not live:
+                start = _moment(rng)
+                end = None if rng.random() < 0.5 else start + timedelta(minutes=rng.randint(0, 120))
+                key = index.add(start, end, payload=step)
+                live[key] = (start, end, step)
+            elif action < 0.75:
+                key = rng.choice(list(live))
+                index.remove(key)
+                del live[key]
+            else:
+                open_keys = [key for key, (_, end, _) in live.items() if end is None]
+                if not open_keys:
+                    continue
+                key = rng.choice(open_keys)
+                start, _, payload = live[key]
+                end = start + timedelta(minutes=rng.randint(0, 120))
+                index.close(key, end)
+                live[key] = (start, end, payload)
+
+            if step % 10 == 0:
+                moment = _moment(rng)
+                assert sorted(index.at(moment)) == _brute_at(live, moment)
+                start = _moment(rng)
+                end = start + timedelta(minutes=rng.randint(0, 90))
+                assert sorted(index.overlapping(start, end)) == _brute_overlapping(live, start, end)
+        assert len(index) == len(live)
+    finally:
+        intervals.MIN_PENDING = minimum
+
+
+def test_interval_bounds_are_inclusive():
+    index = IntervalIndex([(BASE, BASE + timedelta(hours=1), "a")])
+    assert index.at(BASE) == ["a"]
+    assert index.at(BASE + timedelta(hours=1)) == ["a"]
+    assert index.at(BASE + timedelta(hours=1, seconds=1)) == []
+    assert index.overlapping(BASE - timedelta(hours=1), BASE) == ["a"]
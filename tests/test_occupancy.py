@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+import random
+from occupancy import occupancy_curves
+
+WINDOW_START = datetime(2024, 1, 1, 8)
+WINDOW_END = datetime(2024, 1, 1, 20)
+STEP = timedelta(minutes=5)
+
+
+def _rows(rng, count):
+    rows = []
+    for _ in range(count):
+        appearance = WINDOW_START + timedelta(minutes=rng.randint(-120, 780))
+        disappearance = None if rng.random() < 0.15 else appearance + timedelta(minutes=rng.randint(0, 240))
+        rows.append((
+            rng.randint(1, 3),
+            appearance,
+            disappearance,
+            rng.choice(["синий", "серый"]),
+            rng.random() < 0.5,
+        ))
+    return rows
+
+
+def _brute_count(rows, key, moment):
+    # Интервал полуоткрытый [appearance, disappearance), открытый длится до конца окна
+    return sum(
+        1 for train_id, appearance, disappearance, color, helmet_on in rows
+        if (train_id, color, helmet_on) == key
+        and appearance <= moment < (disappearance or WINDOW_END)
+    )
+
+
+def test_resample_matches_brute_force():
+    rng = random.Random(3)
+    rows = _rows(rng, 400)
+    frame = occupancy_curves(rows, WINDOW_START, WINDOW_END).resample(STEP)
+
+    assert frame.index[0].to_pydatetime() == WINDOW_START
+    assert len(frame) == (WINDOW_END - WINDOW_START) // STEP
+    for key in frame.columns:
+        for moment, value in frame[key].items():
+            assert value == _brute_count(rows, key, moment.to_pydatetime())
+
+
+def test_per_train_sums_groups():
+    rng = random.Random(4)
+    rows = _rows(rng, 200)
+    curves = occupancy_curves(rows, WINDOW_START, WINDOW_END)
+    per_train = curves.per_train(STEP)
+    for moment, values in per_train.iterrows():
+        for train_id, value in values.items():
+            expected = sum(
+                1 for row_train, appearance, disappearance, _, _ in rows
+                if row_train == train_id and appearance <= moment.to_pydatetime() < (disappearance or WINDOW_END)
+            )
+            assert value == expected
+
+
+def test_empty_rows():
+    frame = occupancy_curves([], WINDOW_START, WINDOW_END).resample(STEP)
+    assert frame.shape == ((WINDOW_END - WINDOW_START) // STEP, 0)